@@ -1,101 +1,153 @@
+import time
+_boot = time.perf_counter()
 import streamlit as st
-import google.generativeai as genai
-from google.generativeai.types import HarmCategory, HarmBlockThreshold
-import PIL.Image
-import firebase_admin
-from firebase_admin import credentials, firestore
 from datetime import datetime, timedelta
 import json
+import logging
 import os
-import pandas as pd
-import altair as alt
+from cache import get_cache, make_key, QueryCache
+from image_utils import preprocess_image
+from food_index import get_food_index
+from model_backend import stream_text
+from nutrition import (parse_nutrition, calculate_needs, NutritionResult, MealResult, NUTRITION_CONFIG, MEAL_CONFIG,
+                       MAX_MEAL_PHOTOS, build_log_data, chunk_images, merge_meal_results, meal_chunk_start,
+                       meal_chunk_done)
+from concurrent.futures import ThreadPoolExecutor
+from chat_context import ChatContext, SUMMARY_TIMEOUT
+import clients
+import metrics
+from write_queue import get_writer
+metrics.setup_logging()
+# (pandas / altair는 보고서 탭을 그릴 때, 모델과 DB는 처음 쓸 때 불러옵니다 → 첫 화면이 빨리 뜹니다)
+clients.startup.record("app.py import", time.perf_counter() - _boot)
 
 # 1. 페이지 설정
 st.set_page_config(page_title="든든 타이거", page_icon="🐯", layout="wide")
 
-# 2. API 키 설정
-if "GOOGLE_API_KEY" in os.environ:
-    genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
-else:
+# 2. API 키 확인 (MODEL_BACKEND=stub/replay 이면 키 없이도 동작)
+if "GOOGLE_API_KEY" not in os.environ and os.environ.get("MODEL_BACKEND", "gemini").lower() == "gemini":
     st.error("⚠️ API 키가 없습니다. 구글 클라우드 설정을 확인해주세요.")
 
 # ---------------------------------------------------------
 # [핵심] 최짱님이 원하시는 'Gemini 3.0 Flash Preview' 적용
+# 만약 3.0이 일시적 오류라면 비상용으로 1.5를 쓰도록 예외처리 (혹시 몰라서)
 # ---------------------------------------------------------
-try:
-    model = genai.GenerativeModel('gemini-3-flash-preview')
-except Exception as e:
-    st.error(f"모델 설정 오류: {e}")
-    # 만약 3.0이 일시적 오류라면 비상용으로 1.5를 쓰도록 예외처리 (혹시 몰라서)
-    model = genai.GenerativeModel('gemini-1.5-flash')
-
-# 3. 데이터베이스 연결
-if not firebase_admin._apps:
-    try:
-        if os.path.exists("secrets.json"):
-            cred = credentials.Certificate("secrets.json")
-            firebase_admin.initialize_app(cred)
-        else:
-            key_json = os.environ.get("FIREBASE_KEY")
-            if key_json:
-                cred_dict = json.loads(key_json)
-                cred = credentials.Certificate(cred_dict)
-                firebase_admin.initialize_app(cred)
-            else:
-                st.warning("⚠️ DB 연결 키를 찾을 수 없습니다.")
-    except Exception as e:
-        st.error(f"DB 연결 오류: {e}")
+def get_model():
+    return clients.get_model('gemini-3-flash-preview', fallback='gemini-1.5-flash', api_key=os.environ.get("GOOGLE_API_KEY"))
 
-try:
-    db = firestore.client()
-except:
-    db = None
+# 3. 저장소 연결 (처음 필요할 때 연결하고, 이후에는 같은 연결을 씁니다)
+# STORAGE_BACKEND=sqlite 이면 Firestore 없이 로컬 파일에 저장합니다.
+def get_repo():
+    repo = clients.get_repo()
+    if repo is None and clients.db_error:
+        st.warning(f"⚠️ {clients.db_error}")
+    return repo
 
 # --- 세션 상태 초기화 ---
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
+if "chat_context" not in st.session_state:
+    st.session_state.chat_context = ChatContext()
 if "user_info" not in st.session_state:
     st.session_state.user_info = {"nickname": "", "age": 65, "gender": "남성", "height": 170, "weight": 60}
 if "needs" not in st.session_state:
     st.session_state.needs = {}
-
-# --- 헬퍼 함수: 권장 섭취량 계산 ---
-def calculate_needs(age, gender, height, weight):
-    if gender == "남성":
-        bmr = (10 * weight) + (6.25 * height) - (5 * age) + 5
-    else:
-        bmr = (10 * weight) + (6.25 * height) - (5 * age) - 161
-    tdee = int(bmr * 1.2)
-    return {
-        "calories": tdee,
-        "carbs": int((tdee * 0.55) / 4),
-        "protein": int((tdee * 0.20) / 4),
-        "fat": int((tdee * 0.25) / 9),
-        "sugar": 50, "sodium": 2000, "cholesterol": 300, "calcium": 700
-    }
+# Streamlit은 위젯을 누를 때마다 스크립트를 다시 실행하므로, 같은 조회는 세션 캐시에서 꺼냅니다.
+if "query_cache" not in st.session_state:
+    st.session_state.query_cache = QueryCache(ttl_seconds=int(os.environ.get("QUERY_CACHE_TTL", "300")))
+query_cache = st.session_state.query_cache
 
 # --- 헬퍼 함수: 데이터 로드 (불러오기) ---
 def load_user_data(nickname):
-    if not db or not nickname: return False
+    if not nickname: return False
+    repo = get_repo()
+    if not repo: return False
     try:
-        doc_ref = db.collection(u'users').document(nickname)
-        doc = doc_ref.get()
-        if doc.exists:
-            data = doc.to_dict()
-            if 'info' in data: st.session_state.user_info = data['info']
+        # 프로필 저장이 아직 대기열에 있으면 옛 값을 읽을 수 있으니 캐시에 남기지 않습니다.
+        store = not get_writer().has_pending(nickname)
+        data = query_cache.get_or_load((nickname, "user"), lambda: repo.get_user(nickname), store=store)
+        # 화면에서 저장한 프로필(info)이 있어야 불러온 것으로 봅니다. (합계 버전만 적힌 문서 등은 제외)
+        if data and 'info' in data:
+            st.session_state.user_info = data['info']
             if 'needs' in data: st.session_state.needs = data['needs']
             return True
-    except:
+    except Exception as e:
+        metrics.inc("app_errors", where="load_user")
+        metrics.log("app_error", level=logging.WARNING, exc_info=True, where="load_user", error=str(e))
         return False
     return False
 
-# --- 헬퍼 함수: JSON 파싱 ---
-def parse_ai_json(text):
-    try:
-        cleaned_text = text.replace("```json", "").replace("```", "").strip()
-        return json.loads(cleaned_text)
-    except:
+# --- 헬퍼 함수: 오류를 화면에 보여 주고 지표 / 로그에도 남기기 ---
+def show_error(where, e, label="오류"):
+    metrics.inc("app_errors", where=where)
+    metrics.log("app_error", level=logging.ERROR, exc_info=True, where=where, error=str(e))
+    st.error(f"{label}: {e}")
+
+# --- 헬퍼 함수: 모델 호출 (시간은 span "model_call"로 남깁니다) ---
+def generate_text(contents, **kwargs):
+    with metrics.span("model_call"):
+        return get_model().generate_content(contents, **kwargs).text
+
+# --- 헬퍼 함수: 상담 내역 추가 ---
+# 화면에는 최근 MAX_DISPLAY_MESSAGES개만 남기고, 프롬프트용 맥락은 chat_context가 따로 관리합니다.
+MAX_DISPLAY_MESSAGES = 100
+
+def add_chat_message(role, text, pinned=False):
+    st.session_state.chat_history.append({"role": role, "text": text})
+    del st.session_state.chat_history[:-MAX_DISPLAY_MESSAGES]
+    st.session_state.chat_context.add(role, text, pinned=pinned)
+
+# --- 헬퍼 함수: 식단 기록 후 관련 조회 캐시만 비우기 ---
+def invalidate_diet_cache(nickname, date_str):
+    query_cache.invalidate(nickname, "daily", date_str)
+    query_cache.invalidate(nickname, "daily_list")
+    query_cache.invalidate(nickname, "weekly_list")
+
+# --- 헬퍼 함수: JSON 복구 (사진 없이 글만 보내는 값싼 호출) ---
+def repair_json(prompt):
+    return generate_text(prompt, generation_config={"response_mime_type": "application/json"})
+
+# --- 헬퍼 함수: 음식 하나 결과 보여주고 기록하기 ---
+def record_food(data, record_date, meal_type):
+    now = datetime.now()
+    record_time = datetime.combine(record_date, now.time())
+    st.divider()
+    st.markdown(f"### 🍱 {data['food_name']}")
+    c1, c2, c3 = st.columns(3)
+    c1.metric("칼로리", f"{data['calories']} kcal")
+    c2.metric("나트륨", f"{data['sodium']} mg")
+    c3.metric("당류", f"{data['sugar']} g")
+    st.info(f"💊 {data['vitamin_info']}")
+    st.success(f"💡 {data['tips']}")
+
+    # 상담 내역에 자동 추가
+    log_text = f"[식단 기록] {data['food_name']} ({data['calories']}kcal). 나트륨:{data['sodium']}mg, 당류:{data['sugar']}g. 조언:{data['tips']}"
+    add_chat_message("model", log_text, pinned=True)
+
+    # DB 저장 (대기열에 적고 바로 돌아옵니다)
+    log_data = build_log_data(data, record_date, record_time, meal_type, now)
+    get_writer().enqueue_diet_logs(st.session_state.user_info["nickname"], [log_data])
+    invalidate_diet_cache(st.session_state.user_info["nickname"], log_data["date"])
+    st.toast("기록되었습니다!", icon="✅")
+
+# --- 헬퍼 함수: 한 끼(사진 여러 장) 분석 ---
+def analyze_meal_photos(images):
+    cache = get_cache()
+
+    def analyze_chunk(chunk):
+        prompt, cache_key, cached = meal_chunk_start(chunk, cache, get_model().model_name)
+        if cached is not None:
+            return cached
+        result_text = generate_text([prompt, *chunk], generation_config=MEAL_CONFIG)
+        data = parse_nutrition(result_text, MealResult, repair_fn=repair_json)
+        return meal_chunk_done(data, chunk, cache, cache_key)
+
+    chunks = chunk_images(images)
+    with ThreadPoolExecutor(max_workers=len(chunks)) as pool:
+        results = list(pool.map(analyze_chunk, chunks))
+    if not all(results):
         return None
+    return merge_meal_results(results)
 
 # =========================================================
 # 4. 화면 구성 (UI)
@@ -162,18 +214,20 @@ with tab1:
         else:
             prompt = f"당신은 영양사입니다. {nickname}님({age}세)에게 환영 인사를 하세요."
             try:
-                res = model.generate_content(prompt)
-                st.success(res.text)
-                if db:
-                    db.collection(u'users').document(nickname).set({
-                        u'info': st.session_state.user_info,
-                        u'needs': needs,
-                        u'goals': goals,
-                        u'last_login': datetime.now()
-                    }, merge=True)
-                    st.caption("✅ 저장 완료")
+                # [스트리밍] 다 만들어질 때까지 기다리지 않고 글자가 나오는 대로 보여줍니다.
+                with st.container(border=True), metrics.span("model_call"):
+                    st.write_stream(stream_text(get_model(), prompt, metric="greeting"))
+                # [나중에 쓰기] 로컬 대기열에 적고 바로 돌아옵니다. DB 전송은 백그라운드에서.
+                get_writer().enqueue_profile(nickname, {
+                    u'info': st.session_state.user_info,
+                    u'needs': needs,
+                    u'goals': goals,
+                    u'last_login': datetime.now()
+                })
+                query_cache.invalidate(nickname, "user")
+                st.caption("✅ 저장 완료")
             except Exception as e:
-                st.error(f"오류: {e}")
+                show_error("greeting", e)
 
 # ---------------------------------------------------------
 # [탭 2] 식단 기록 (Gemini 3.0 활용)
@@ -190,66 +244,107 @@ with tab2:
         with col_meal:
             meal_type = st.selectbox("어떤 식사인가요?", ["아침", "점심", "저녁", "간식"])
 
-        uploaded_file = st.file_uploader("음식 사진 업로드", type=["jpg", "png", "jpeg"])
+        # 자주 드시는 음식은 이름만으로(또는 전에 찍은 것과 비슷한 사진이면) 모델 없이 바로 답합니다.
+        dish_name = st.text_input("음식 이름 (알고 계시면 적어 주세요)", "", placeholder="예: 김치찌개, 비빔밥")
+        uploaded_files = st.file_uploader("음식 사진 업로드 (한 끼에 여러 장 가능)", type=["jpg", "png", "jpeg"], accept_multiple_files=True)
         
-        if uploaded_file:
-            st.image(uploaded_file, width=300)
+        if uploaded_files and len(uploaded_files) > MAX_MEAL_PHOTOS:
+            st.warning(f"사진은 한 번에 {MAX_MEAL_PHOTOS}장까지 분석할 수 있어요. 나눠서 올려 주세요.")
+        elif uploaded_files:
+            st.image(uploaded_files, width=300 if len(uploaded_files) == 1 else 180)
             
             if st.button("Gemini 3.0 정밀 분석 ⚡"):
                 with st.spinner("슈퍼 호랑이가 분석 중입니다..."):
                     try:
-                        img = PIL.Image.open(uploaded_file)
-                        
-                        system_prompt = f"""
-                        당신은 시니어 전문 임상영양사 '든든 타이거'입니다.
-                        사진 속 음식을 정밀 분석하여 아래 JSON 포맷으로 응답하세요.
-                        
-                        {{
-                            "food_name": "음식 이름",
-                            "calories": 000,
-                            "carbs": 00, "protein": 00, "fat": 00, 
-                            "sugar": 00, "sodium": 000, "cholesterol": 000, "calcium": 000,
-                            "vitamin_info": "비타민/무기질 정보 (한 줄 요약)",
-                            "analysis": "영양 평가",
-                            "tips": "건강 섭취 조언"
-                        }}
-                        """
-                        res = model.generate_content([system_prompt, img])
-                        data = parse_ai_json(res.text)
-                        
-                        if data:
-                            st.divider()
-                            st.markdown(f"### 🍱 {data['food_name']}")
-                            c1, c2, c3 = st.columns(3)
-                            c1.metric("칼로리", f"{data['calories']} kcal")
-                            c2.metric("나트륨", f"{data['sodium']} mg")
-                            c3.metric("당류", f"{data['sugar']} g")
-                            st.info(f"💊 {data['vitamin_info']}")
-                            st.success(f"💡 {data['tips']}")
+                        # [전처리] 방향 보정 + 축소 + 재압축한 사진으로 키를 만들고 업로드합니다.
+                        images = [preprocess_image(f.getvalue()) for f in uploaded_files]
+
+                        if len(images) == 1:
+                            system_prompt = f"""
+                            당신은 시니어 전문 임상영양사 '든든 타이거'입니다.
+                            사진 속 음식을 정밀 분석하여 아래 JSON 포맷으로 응답하세요.
+                            
+                            {{
+                                "food_name": "음식 이름",
+                                "calories": 000,
+                                "carbs": 00, "protein": 00, "fat": 00, 
+                                "sugar": 00, "sodium": 000, "cholesterol": 000, "calcium": 000,
+                                "vitamin_info": "비타민/무기질 정보 (한 줄 요약)",
+                                "analysis": "영양 평가",
+                                "tips": "건강 섭취 조언"
+                            }}
+                            """
+                            img = images[0]
+                            nickname = st.session_state.user_info["nickname"]
+                            # [로컬] 음식 이름이 표에 있거나, 전에 분석한 사진과 거의 같으면 모델을 부르지 않습니다.
+                            food_index = get_food_index()
+                            data, source, photo_hash = food_index.find(nickname, dish_name, img["data"])
+                            # [캐시] 같은 사진을 다시 올리면 Gemini를 다시 부르지 않습니다.
+                            cache = get_cache()
+                            cache_key = make_key(img["data"], system_prompt, get_model().model_name)
+                            if data is None:
+                                cached = cache.get(cache_key)
+                                source = "cache" if cached is not None else None
+                                if cached is not None:
+                                    data = json.loads(cached)
+                                else:
+                                    # JSON 형식을 강제하고, 그래도 깨지면 글만으로 복구를 시도합니다.
+                                    result_text = generate_text([system_prompt, img], generation_config=NUTRITION_CONFIG)
+                                    data = parse_nutrition(result_text, NutritionResult, repair_fn=repair_json)
                             
-                            # 상담 내역에 자동 추가
-                            log_text = f"[식단 기록] {data['food_name']} ({data['calories']}kcal). 나트륨:{data['sodium']}mg, 당류:{data['sugar']}g. 조언:{data['tips']}"
-                            st.session_state.chat_history.append({"role": "model", "text": log_text})
-
-                            # DB 저장
-                            if db:
-                                log_data = {
-                                    "date": record_date.strftime("%Y-%m-%d"),
-                                    "datetime": datetime.combine(record_date, datetime.now().time()),
-                                    "meal_type": meal_type,
-                                    "food_name": data['food_name'],
-                                    "calories": data['calories'], "carbs": data['carbs'], "protein": data['protein'], "fat": data['fat'],
-                                    "sugar": data.get('sugar', 0), "sodium": data.get('sodium', 0),
-                                    "cholesterol": data.get('cholesterol', 0), "calcium": data.get('calcium', 0),
-                                    "vitamin_info": data.get('vitamin_info', ''),
-                                    "timestamp": datetime.now()
-                                }
-                                db.collection('users').document(st.session_state.user_info["nickname"]).collection('diet_logs').add(log_data)
-                                st.toast("기록되었습니다!", icon="✅")
+                            if data:
+                                # 검증을 통과한 결과만 저장해야 재시도 시 같은 오류를 반복하지 않습니다.
+                                if source is None:
+                                    cache.set(cache_key, json.dumps(data, ensure_ascii=False))
+                                if source != "table":
+                                    food_index.remember(nickname, photo_hash, data)
+                                if source:
+                                    ratio = food_index.stats()["local_hit_ratio"]
+                                    reason = {"table": "음식 표로", "photo": "비슷한 예전 사진으로", "cache": "이전 분석 결과로"}[source]
+                                    st.caption(f"⚡ {reason} 바로 답했습니다 (로컬 답변 비율 {ratio:.0%})")
+                                record_food(data, record_date, meal_type)
+                            else:
+                                st.error("분석 실패 (AI 응답 오류)")
                         else:
-                            st.error("분석 실패 (AI 응답 오류)")
+                            # [한 끼 분석] 여러 장을 한 번의 요청으로 (많으면 나눠서 동시에) 보냅니다.
+                            meal = analyze_meal_photos(images)
+                            if meal and meal["items"]:
+                                now = datetime.now()
+                                record_time = datetime.combine(record_date, now.time())
+                                total = meal["total"]
+                                st.divider()
+                                st.markdown(f"### 🍱 한 끼 분석 ({len(meal['items'])}가지 음식)")
+                                for item in meal["items"]:
+                                    st.markdown(f"- **{item.get('food_name', '')}**: {item.get('calories', 0)} kcal · 나트륨 {item.get('sodium', 0)} mg · 당류 {item.get('sugar', 0)} g")
+                                c1, c2, c3 = st.columns(3)
+                                c1.metric("총 칼로리", f"{total['calories']:g} kcal")
+                                c2.metric("총 나트륨", f"{total['sodium']:g} mg")
+                                c3.metric("총 당류", f"{total['sugar']:g} g")
+                                if meal["tips"]:
+                                    st.success(f"💡 {meal['tips']}")
+
+                                # 상담 내역에 자동 추가
+                                names = ", ".join(item.get("food_name", "") for item in meal["items"])
+                                log_text = f"[식단 기록] {names} (총 {total['calories']:g}kcal). 나트륨:{total['sodium']:g}mg, 당류:{total['sugar']:g}g. 조언:{meal['tips']}"
+                                add_chat_message("model", log_text, pinned=True)
+
+                                # DB 저장: 음식별 기록을 한 묶음으로 대기열에 (batch 한 번으로 전송)
+                                logs = [build_log_data(item, record_date, record_time, meal_type, now) for item in meal["items"]]
+                                get_writer().enqueue_diet_logs(st.session_state.user_info["nickname"], logs)
+                                invalidate_diet_cache(st.session_state.user_info["nickname"], logs[0]["date"])
+                                st.toast(f"{len(logs)}건 기록되었습니다!", icon="✅")
+                            else:
+                                st.error("분석 실패 (AI 응답 오류)")
                     except Exception as e:
-                        st.error(f"오류: {e}")
+                        show_error("food_analysis", e)
+        elif dish_name:
+            # 사진 없이 이름만: 음식 표에 있으면 바로 기록합니다.
+            if st.button("이름으로 기록 📝"):
+                data, _, _ = get_food_index().find(name=dish_name)
+                if data:
+                    record_food(data, record_date, meal_type)
+                else:
+                    st.warning("목록에 없는 음식입니다. 사진을 올려 주시면 분석해 드릴게요.")
 
 # ---------------------------------------------------------
 # [탭 3] 건강 보고서
@@ -259,45 +354,76 @@ with tab3:
     
     if not st.session_state.user_info["nickname"]:
         st.info("닉네임을 설정하면 보고서가 보입니다.")
-    elif db:
-        report_type = st.radio("종류", ["일간 분석", "최근 추이"], horizontal=True)
-        docs_ref = db.collection('users').document(st.session_state.user_info["nickname"]).collection('diet_logs')
+    elif (repo := get_repo()):
+        import pandas as pd
+        import altair as alt
+
+        report_type = st.radio("종류", ["일간 분석", "최근 추이", "주간 추이"], horizontal=True)
+        report_nick = st.session_state.user_info["nickname"]
         my_needs = st.session_state.needs if st.session_state.needs else calculate_needs(65, "남성", 170, 60)
 
+        # 아직 저장소로 보내지 못한 기록이 있으면, 읽은 결과를 캐시에 남기지 않습니다.
+        cache_reads = not get_writer().has_pending(report_nick)
+
+        # 합계 문서가 없던 시절의 기록은 세션당 한 번만 확인해서 재계산합니다.
+        if st.session_state.get("rollups_checked") != report_nick:
+            if repo.ensure_rollups(report_nick):
+                query_cache.invalidate(report_nick)
+            st.session_state.rollups_checked = report_nick
+
         if report_type == "일간 분석":
             report_date = st.date_input("날짜 선택", datetime.now())
             date_str = report_date.strftime("%Y-%m-%d")
-            daily_logs = [doc.to_dict() for doc in docs_ref.where("date", "==", date_str).stream()]
+            # 하루 합계 문서 하나만 읽습니다.
+            daily = query_cache.get_or_load((report_nick, "daily", date_str), lambda: repo.get_daily_rollup(report_nick, date_str), store=cache_reads)
             
-            if daily_logs:
-                df = pd.DataFrame(daily_logs)
-                st.markdown("#### 1️⃣ 영양소 섭취량 (g)")
-                chart_data_g = pd.DataFrame({
-                    "영양소": ["탄수화물", "탄수화물", "단백질", "단백질", "지방", "지방", "당류", "당류"],
-                    "구분": ["섭취량", "권장량"] * 4,
-                    "값(g)": [df['carbs'].sum(), my_needs['carbs'], df['protein'].sum(), my_needs['protein'], df['fat'].sum(), my_needs['fat'], df.get('sugar', pd.Series([0])).sum(), my_needs['sugar']]
-                })
-                st.altair_chart(alt.Chart(chart_data_g).mark_bar().encode(x='값(g)', y='영양소', color='구분'), use_container_width=True)
+            if daily and daily.get("count"):
+                # 그래프 그리기 시간은 span "chart_build"로 남깁니다.
+                with metrics.span("chart_build"):
+                    st.markdown("#### 1️⃣ 영양소 섭취량 (g)")
+                    chart_data_g = pd.DataFrame({
+                        "영양소": ["탄수화물", "탄수화물", "단백질", "단백질", "지방", "지방", "당류", "당류"],
+                        "구분": ["섭취량", "권장량"] * 4,
+                        "값(g)": [daily.get('carbs', 0), my_needs['carbs'], daily.get('protein', 0), my_needs['protein'], daily.get('fat', 0), my_needs['fat'], daily.get('sugar', 0), my_needs['sugar']]
+                    })
+                    st.altair_chart(alt.Chart(chart_data_g).mark_bar().encode(x='값(g)', y='영양소', color='구분'), use_container_width=True)
                 
-                st.markdown("#### 2️⃣ 관리 지표 (mg)")
-                chart_data_mg = pd.DataFrame({
-                    "영양소": ["나트륨", "나트륨", "콜레스테롤", "콜레스테롤"],
-                    "구분": ["섭취량", "상한선"] * 2,
-                    "값(mg)": [df.get('sodium', pd.Series([0])).sum(), my_needs['sodium'], df.get('cholesterol', pd.Series([0])).sum(), my_needs['cholesterol']]
-                })
-                st.altair_chart(alt.Chart(chart_data_mg).mark_bar().encode(x='값(mg)', y='영양소', color='구분'), use_container_width=True)
+                    st.markdown("#### 2️⃣ 관리 지표 (mg)")
+                    chart_data_mg = pd.DataFrame({
+                        "영양소": ["나트륨", "나트륨", "콜레스테롤", "콜레스테롤"],
+                        "구분": ["섭취량", "상한선"] * 2,
+                        "값(mg)": [daily.get('sodium', 0), my_needs['sodium'], daily.get('cholesterol', 0), my_needs['cholesterol']]
+                    })
+                    st.altair_chart(alt.Chart(chart_data_mg).mark_bar().encode(x='값(mg)', y='영양소', color='구분'), use_container_width=True)
             else:
                 st.info("기록이 없습니다.")
+        elif report_type == "최근 추이":
+            # 최근 30일 범위의 하루 합계만 (사용자, 날짜) 인덱스로 읽습니다.
+            start_str = (datetime.now() - timedelta(days=29)).strftime("%Y-%m-%d")
+            data_list = query_cache.get_or_load((report_nick, "daily_list", start_str), lambda: repo.list_daily_rollups(report_nick, start_date=start_str, limit=30), store=cache_reads)
+            if data_list:
+                with metrics.span("chart_build"):
+                    stats = pd.DataFrame(data_list).sort_values('date')
+                    st.line_chart(stats, x='date', y=['sodium', 'sugar'])
+            else:
+                st.info("데이터가 없습니다.")
         else:
-            all_logs = docs_ref.order_by("date", direction=firestore.Query.DESCENDING).limit(50).stream()
-            data_list = [d.to_dict() for d in all_logs]
+            # 최근 12주 범위의 주간 합계 → 하루 평균으로 표시
+            start_str = (datetime.now() - timedelta(weeks=11)).strftime("%Y-%m-%d")
+            data_list = query_cache.get_or_load((report_nick, "weekly_list", start_str), lambda: repo.list_weekly_rollups(report_nick, start_date=start_str, limit=12), store=cache_reads)
             if data_list:
-                df_period = pd.DataFrame(data_list)
-                stats = df_period.groupby('date')[['sodium', 'sugar']].sum().reset_index()
-                st.line_chart(stats, x='date', y=['sodium', 'sugar'])
+                with metrics.span("chart_build"):
+                    stats = pd.DataFrame(data_list).sort_values('week')
+                    stats['sodium'] = stats['sodium'] / 7
+                    stats['sugar'] = stats['sugar'] / 7
+                    st.caption("주간 합계를 7로 나눈 하루 평균입니다.")
+                    st.line_chart(stats, x='week', y=['sodium', 'sugar'])
             else:
                 st.info("데이터가 없습니다.")
 
+        qc_stats = query_cache.stats()
+        st.caption(f"🔁 조회 캐시 적중률 {qc_stats['hit_rate']:.0%} (캐시 {qc_stats['hits']}회 / DB 조회 {qc_stats['misses']}회)")
+
 # ---------------------------------------------------------
 # [탭 4] 영양 상담소 (Gemini 3.0 맞춤형 프롬프트 강화)
 # ---------------------------------------------------------
@@ -311,34 +437,42 @@ with tab4:
     if prompt := st.chat_input("예: 방금 먹은 음식 영양소 괜찮아?"):
         st.chat_message("user").markdown(prompt)
         st.session_state.chat_history.append({"role": "user", "text": prompt})
+        chat_context = st.session_state.chat_context
 
         with st.chat_message("model"):
-            with st.spinner("호랑이가 생각 중입니다..."):
-                try:
-                    # [상담 강화] 3.0 모델이 잘 알아듣도록 명확한 페르소나와 정보를 줍니다.
-                    info = st.session_state.user_info
-                    needs = st.session_state.needs
-                    
-                    full_system_prompt = f"""
-                    [시스템 설정]
-                    당신은 대학병원 임상영양사 '든든 타이거'입니다.
-                    사용자 정보: {info.get('nickname')} ({info.get('age')}세/{info.get('gender')})
-                    건강 목표: {needs.get('sodium', 2000)}mg 미만 나트륨 섭취, 혈당 관리.
-                    
-                    [지시사항]
-                    1. 사용자의 질문에 대해 '영양학적 근거'를 바탕으로 답변하세요.
-                    2. 말투는 따뜻하고 정중한 존댓말(해요체)을 쓰세요.
-                    3. 이전 대화에 식단 기록이 있다면, 그 음식의 영양 성분을 언급하며 구체적으로 조언하세요.
-                    4. 너무 길지 않게 핵심만 답변하세요.
-                    """
-                    
-                    # 대화 기록 누적
-                    history_text = "\n".join([f"{m['role']}: {m['text']}" for m in st.session_state.chat_history])
-                    final_input = f"{full_system_prompt}\n\n[대화 내용]\n{history_text}\n\n사용자: {prompt}\n답변:"
-                    
-                    response = model.generate_content(final_input)
-                    st.markdown(response.text)
-                    st.session_state.chat_history.append({"role": "model", "text": response.text})
-                    
-                except Exception as e:
-                    st.error(f"응답 오류: {e}")
\ No newline at end of file
+            try:
+                # [상담 강화] 3.0 모델이 잘 알아듣도록 명확한 페르소나와 정보를 줍니다.
+                info = st.session_state.user_info
+                needs = st.session_state.needs
+                
+                full_system_prompt = f"""
+                [시스템 설정]
+                당신은 대학병원 임상영양사 '든든 타이거'입니다.
+                사용자 정보: {info.get('nickname')} ({info.get('age')}세/{info.get('gender')})
+                건강 목표: {needs.get('sodium', 2000)}mg 미만 나트륨 섭취, 혈당 관리.
+                
+                [지시사항]
+                1. 사용자의 질문에 대해 '영양학적 근거'를 바탕으로 답변하세요.
+                2. 말투는 따뜻하고 정중한 존댓말(해요체)을 쓰세요.
+                3. 이전 대화에 식단 기록이 있다면, 그 음식의 영양 성분을 언급하며 구체적으로 조언하세요.
+                4. 너무 길지 않게 핵심만 답변하세요.
+                """
+                
+                # 대화 기록: 최근 대화 + 오래된 대화 요약 + 식단 기록 (토큰 예산 안으로)
+                # (요약 호출에는 제한 시간을 걸어, 멈춘 호출이 요약 스레드를 붙잡고 있지 않게 합니다)
+                chat_context.maybe_summarize(
+                    lambda summary_input: generate_text(summary_input, request_options={"timeout": SUMMARY_TIMEOUT}))
+                history_text = chat_context.build_history()
+                final_input = f"{full_system_prompt}\n\n[대화 내용]\n{history_text}\n\n사용자: {prompt}\n답변:"
+                chat_context.add("user", prompt)
+                
+                # [스트리밍] 답변을 나오는 대로 화면에 그립니다.
+                with metrics.span("model_call"):
+                    answer = st.write_stream(stream_text(get_model(), final_input, metric="chat"))
+                add_chat_message("model", answer)
+                
+            except Exception as e:
+                show_error("chat", e, label="응답 오류")
+
+# 첫 실행이 끝나면 초기화 시간 요약을 한 번 출력합니다.
+clients.startup.report()
\ No newline at end of file
@@ -0,0 +1,210 @@
+# batch_report.py (요양 시설용 야간 일괄 보고서: 여러 사람의 권장량 / 하루 부족·과다 점수)
+# 실행: python batch_report.py --profiles residents.csv --logs diet_logs.parquet --out report.parquet --start 2026-10-17
+# - 프로필 표(nickname, age, gender, height, weight)와 식단 기록 표(nickname, date, 영양소...)를 받습니다. (CSV / Parquet)
+# - 한 사람씩 반복하지 않고 열(column) 단위로 한 번에 계산합니다. (numpy / pandas)
+# - 식단 기록은 조각(chunk)으로 읽으면서 (사람, 날짜)별 합계로 줄이고, 결과도 조각마다 파일에 이어 씁니다.
+#   → 사용자가 많아도 메모리에 기록 전체를 올리지 않습니다.
+# - 기간(--start ~ --end, 없으면 기록의 첫날~마지막 날) 안에서 기록이 없는 날도 '0kcal, 0끼'인 날로 점수를 매깁니다.
+#   (식사를 거른 날이 빠지면 가장 부족한 사람이 보고서에서 사라지므로)
+# - Parquet 입출력에는 pyarrow가 필요합니다. (pip install pyarrow)
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from nutrition import ACTIVITY_FACTOR, DEFAULT_PROFILE, FIXED_NEEDS, MACRO_RATIOS, NUTRIENT_KEYS, to_number
+
+# 모자라면 문제인 영양소 / 넘치면 문제인 영양소 (칼로리는 양쪽 모두 봅니다)
+DEFICIT_KEYS = ["calories", "carbs", "protein", "calcium"]
+EXCESS_KEYS = ["calories", "fat", "sugar", "sodium", "cholesterol"]
+# 권장량 대비 이 비율보다 낮으면 '부족', 높으면 '과다'로 표시합니다.
+DEFICIT_FLAG_RATIO = 0.7
+EXCESS_FLAG_RATIO = 1.1
+
+PROFILE_COLUMNS = ["nickname", "age", "gender", "height", "weight"]
+
+
+# --- 권장 섭취량: nutrition.calculate_needs와 같은 식을 여러 사람에게 한 번에 ---
+def calculate_needs_frame(profiles):
+    profiles = profiles.fillna(DEFAULT_PROFILE)
+    age = profiles["age"].to_numpy(dtype=float)
+    height = profiles["height"].to_numpy(dtype=float)
+    weight = profiles["weight"].to_numpy(dtype=float)
+    offset = np.where(profiles["gender"].to_numpy() == "남성", 5, -161)
+    bmr = (10 * weight) + (6.25 * height) - (5 * age) + offset
+    tdee = np.trunc(bmr * ACTIVITY_FACTOR)
+
+    needs = pd.DataFrame({"nickname": profiles["nickname"].to_numpy(), "calories": tdee.astype(np.int64)})
+    for key, (ratio, kcal) in MACRO_RATIOS.items():
+        needs[key] = np.trunc((tdee * ratio) / kcal).astype(np.int64)
+    for key, value in FIXED_NEEDS.items():
+        needs[key] = value
+    return needs
+
+
+# --- 숫자 열 정리: 대부분은 바로 숫자로 바꾸고, "120kcal" 같은 값만 to_number로 ---
+def _numeric(column):
+    values = pd.to_numeric(column, errors="coerce")
+    broken = values.isna() & column.notna()
+    if broken.any():
+        values[broken] = column[broken].map(to_number)
+    return values.fillna(0).astype(float)
+
+
+# --- 표 읽기: CSV / Parquet를 조각으로 ---
+def _read_chunks(path, columns, chunksize):
+    if str(path).endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(path)
+        available = [c for c in columns if c in parquet.schema_arrow.names]
+        for batch in parquet.iter_batches(batch_size=chunksize, columns=available):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(
+            path, chunksize=chunksize, usecols=lambda c: c in columns,
+            dtype={"nickname": str, "date": str},
+        )
+
+
+def read_profiles(path):
+    profiles = pd.concat(_read_chunks(path, PROFILE_COLUMNS, 500_000), ignore_index=True)
+    return profiles.drop_duplicates("nickname", keep="last")
+
+
+# 식단 기록 → (nickname, date)별 하루 합계 + 기록 수(meals)
+def read_daily_totals(path, start_date=None, end_date=None, chunksize=500_000):
+    parts = []
+    for chunk in _read_chunks(path, ["nickname", "date", *NUTRIENT_KEYS], chunksize):
+        chunk["date"] = chunk["date"].astype(str).str[:10]
+        if start_date:
+            chunk = chunk[chunk["date"] >= start_date]
+        if end_date:
+            chunk = chunk[chunk["date"] <= end_date]
+        if chunk.empty:
+            continue
+        for key in NUTRIENT_KEYS:
+            chunk[key] = _numeric(chunk[key]) if key in chunk else 0.0
+        chunk["meals"] = 1
+        parts.append(chunk.groupby(["nickname", "date"], sort=False)[[*NUTRIENT_KEYS, "meals"]].sum())
+    if not parts:
+        return pd.DataFrame(columns=["nickname", "date", *NUTRIENT_KEYS, "meals"])
+    totals = pd.concat(parts).groupby(level=[0, 1]).sum().reset_index()
+    totals[NUTRIENT_KEYS] = totals[NUTRIENT_KEYS].round(1)
+    return totals
+
+
+# 보고서 날짜 목록: 주어진 기간, 없으면 기록이 있는 첫날~마지막 날
+def report_dates(daily, start_date=None, end_date=None):
+    first = start_date or (daily["date"].min() if len(daily) else None)
+    last = end_date or (daily["date"].max() if len(daily) else None)
+    if not first or not last:
+        return pd.Index([], dtype=object)
+    return pd.date_range(first, last, freq="D").strftime("%Y-%m-%d")
+
+
+# --- 하루 점수 ---
+# ratio = 섭취량 / 권장량
+# deficit_score: DEFICIT_KEYS의 (1 - ratio)를 0~1로 자른 평균 (0이면 부족 없음)
+# excess_score: EXCESS_KEYS의 (ratio - 1)을 0 이상으로 자른 평균 (0이면 과다 없음)
+def score_days(daily, needs):
+    scored = daily.merge(needs, on="nickname", how="left", suffixes=("", "_need"))
+    # 프로필이 없는 사람은 기본 프로필의 권장량으로 봅니다.
+    default_needs = calculate_needs_frame(pd.DataFrame([{"nickname": "", **DEFAULT_PROFILE}])).iloc[0]
+    for key in NUTRIENT_KEYS:
+        need = scored[f"{key}_need"].fillna(default_needs[key]).to_numpy(dtype=float)
+        scored[f"{key}_need"] = need
+        scored[f"{key}_ratio"] = np.divide(
+            scored[key].to_numpy(dtype=float), need, out=np.zeros(len(scored)), where=need > 0,
+        ).round(3)
+
+    deficit = np.column_stack([np.clip(1 - scored[f"{k}_ratio"].to_numpy(), 0, 1) for k in DEFICIT_KEYS])
+    excess = np.column_stack([np.clip(scored[f"{k}_ratio"].to_numpy() - 1, 0, None) for k in EXCESS_KEYS])
+    scored["deficit_score"] = deficit.mean(axis=1).round(3)
+    scored["excess_score"] = excess.mean(axis=1).round(3)
+    scored["deficit_flags"] = _flags(scored, DEFICIT_KEYS, lambda r: r < DEFICIT_FLAG_RATIO)
+    scored["excess_flags"] = _flags(scored, EXCESS_KEYS, lambda r: r > EXCESS_FLAG_RATIO)
+    return scored
+
+
+def _flags(scored, keys, condition):
+    flags = pd.Series("", index=scored.index)
+    for key in keys:
+        flags = flags + np.where(condition(scored[f"{key}_ratio"].to_numpy()), f"{key},", "")
+    return flags.str.rstrip(",")
+
+
+# --- 결과 쓰기: 조각마다 이어 쓰기 ---
+class ReportWriter:
+    def __init__(self, path):
+        self.path = str(path)
+        self.rows = 0
+        self._parquet = None
+
+    def write(self, frame):
+        if self.path.endswith(".parquet"):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.path, table.schema)
+            self._parquet.write_table(table.cast(self._parquet.schema))
+        else:
+            frame.to_csv(self.path, mode="w" if self.rows == 0 else "a", header=self.rows == 0, index=False)
+        self.rows += len(frame)
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+
+
+def run_report(profiles_path, logs_path, out_path, start_date=None, end_date=None, chunk_users=20_000):
+    timings = {}
+    start = time.perf_counter()
+    profiles = read_profiles(profiles_path)
+    timings["read_profiles"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    needs = calculate_needs_frame(profiles)
+    timings["needs"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    daily = read_daily_totals(logs_path, start_date, end_date)
+    timings["read_logs"] = time.perf_counter() - start
+
+    # 대상: 프로필에 있는 사람 전부 + 프로필 없이 기록만 있는 사람 (기본 프로필 권장량으로 봅니다)
+    # 사람 단위로 나눠서 (사람 × 날짜) 표를 만들고, 기록이 없는 칸은 0으로 채워 점수 → 파일.
+    start = time.perf_counter()
+    dates = report_dates(daily, start_date, end_date)
+    nicknames = pd.Index(profiles["nickname"]).append(pd.Index(daily["nickname"])).unique()
+    if len(dates) == 0:
+        nicknames = nicknames[:0]
+    daily = daily.set_index(["nickname", "date"])
+    writer = ReportWriter(out_path)
+    try:
+        for i in range(0, len(nicknames), chunk_users):
+            grid = pd.MultiIndex.from_product([nicknames[i:i + chunk_users], dates], names=["nickname", "date"])
+            part = daily.reindex(grid, fill_value=0).reset_index()
+            writer.write(score_days(part, needs))
+    finally:
+        writer.close()
+    timings["score_and_write"] = time.perf_counter() - start
+    return {"users": len(nicknames), "rows": writer.rows, "timings": timings}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="여러 사람의 하루 영양 부족/과다 점수를 계산합니다.")
+    parser.add_argument("--profiles", required=True, help="nickname, age, gender, height, weight 열이 있는 CSV/Parquet")
+    parser.add_argument("--logs", required=True, help="nickname, date, 영양소 열이 있는 CSV/Parquet")
+    parser.add_argument("--out", required=True, help="결과 파일 (.csv 또는 .parquet)")
+    parser.add_argument("--start", help="시작 날짜 YYYY-MM-DD (포함)")
+    parser.add_argument("--end", help="끝 날짜 YYYY-MM-DD (포함)")
+    parser.add_argument("--chunk-users", type=int, default=20_000)
+    args = parser.parse_args()
+
+    result = run_report(args.profiles, args.logs, args.out, args.start, args.end, args.chunk_users)
+    print(f"✅ {result['users']}명, {result['rows']}일치 점수를 {args.out}에 저장했습니다.")
+    for name, seconds in result["timings"].items():
+        print(f"   {name:<16} {seconds * 1000:8.0f}ms")
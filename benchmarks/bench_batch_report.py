@@ -0,0 +1,99 @@
+# benchmarks/bench_batch_report.py (일괄 보고서: 사용자 수에 따른 처리 시간)
+# 실행: python benchmarks/bench_batch_report.py --users 100,1000,10000,100000 --days 1 [--format parquet]
+#   (--format parquet은 pyarrow가 필요합니다: pip install pyarrow. 앱 requirements에는 넣지 않습니다)
+# - 가짜 프로필 / 식단 기록(하루 세 끼)을 임시 폴더에 만들고 batch_report.run_report를 돌립니다.
+# - 권장량 계산은 한 사람씩 부르는 방식(nutrition.calculate_needs)과 열 단위 계산을 함께 비교합니다.
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_report import calculate_needs_frame, run_report  # noqa: E402
+from nutrition import calculate_needs  # noqa: E402
+
+# 한 끼 영양소의 대략적인 범위 (균등 분포로 뽑습니다)
+MEAL_RANGES = {
+    "calories": (250, 900), "carbs": (30, 130), "protein": (5, 40), "fat": (3, 35),
+    "sugar": (0, 30), "sodium": (200, 2000), "cholesterol": (0, 200), "calcium": (20, 400),
+}
+
+
+def make_data(n_users, n_days, seed=0):
+    rng = np.random.default_rng(seed)
+    nicknames = np.array([f"resident{i:06d}" for i in range(n_users)])
+    profiles = pd.DataFrame({
+        "nickname": nicknames,
+        "age": rng.integers(60, 95, n_users),
+        "gender": rng.choice(["남성", "여성"], n_users),
+        "height": rng.integers(145, 185, n_users),
+        "weight": rng.integers(40, 90, n_users),
+    })
+    days = [(date(2026, 10, 1) + timedelta(days=d)).isoformat() for d in range(n_days)]
+    n_logs = n_users * n_days * 3
+    logs = pd.DataFrame({
+        "nickname": np.repeat(nicknames, n_days * 3),
+        "date": np.tile(np.repeat(days, 3), n_users),
+        **{key: rng.uniform(lo, hi, n_logs).round(1) for key, (lo, hi) in MEAL_RANGES.items()},
+    })
+    return profiles, logs
+
+
+def save(frame, path):
+    if path.endswith(".parquet"):
+        frame.to_parquet(path, index=False)
+    else:
+        frame.to_csv(path, index=False)
+
+
+def bench_needs(profiles, scalar_max):
+    start = time.perf_counter()
+    calculate_needs_frame(profiles)
+    vectorized = time.perf_counter() - start
+    if len(profiles) > scalar_max:
+        return vectorized, None
+    start = time.perf_counter()
+    for row in profiles.itertuples(index=False):
+        calculate_needs(row.age, row.gender, row.height, row.weight)
+    return vectorized, time.perf_counter() - start
+
+
+def main(args):
+    sizes = [int(s) for s in args.users.split(",")]
+    print(f"기간 {args.days}일, 하루 세 끼, 형식 {args.format}")
+    print(f"{'users':>8} {'logs':>9} {'needs(vec)':>11} {'needs(loop)':>12} {'report':>9} {'users/s':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_users in sizes:
+            profiles, logs = make_data(n_users, args.days)
+            profiles_path = os.path.join(tmp, f"profiles.{args.format}")
+            logs_path = os.path.join(tmp, f"logs.{args.format}")
+            out_path = os.path.join(tmp, f"report.{args.format}")
+            save(profiles, profiles_path)
+            save(logs, logs_path)
+
+            vectorized, loop = bench_needs(profiles, args.scalar_max)
+            start = time.perf_counter()
+            result = run_report(profiles_path, logs_path, out_path)
+            elapsed = time.perf_counter() - start
+            assert result["rows"] == n_users * args.days
+            assert result["users"] == n_users
+            loop_text = f"{loop * 1000:10.1f}ms" if loop is not None else f"{'-':>12}"
+            print(
+                f"{n_users:>8} {len(logs):>9} {vectorized * 1000:9.1f}ms {loop_text} "
+                f"{elapsed:8.2f}s {n_users / elapsed:10.0f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", default="100,1000,10000,100000")
+    parser.add_argument("--days", type=int, default=1)
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--scalar-max", type=int, default=100000, help="이 수보다 많으면 한 사람씩 계산은 건너뜁니다")
+    main(parser.parse_args())
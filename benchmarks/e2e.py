@@ -0,0 +1,466 @@
+# benchmarks/e2e.py (API + 화면 흐름 전체를 가짜 모델 / 로컬 저장소로 재는 성능 회귀 시험)
+# 실행: python benchmarks/e2e.py --requests 30 --out benchmarks/results/e2e.json [--baseline 지난번.json]
+# - api_greeting      : main.py /api/v1/greeting (프로세스 안 HTTP 클라이언트, httpx ASGITransport)
+# - api_analyze_food  : main.py /api/v1/analyze_food, 사진 크기별 (--image-edges, 사진마다 내용이 달라 캐시에 걸리지 않음)
+# - app_greeting      : app.py 탭 1 "설정 저장 및 인사" (Streamlit AppTest)
+# - app_dish_name     : app.py 탭 2 "이름으로 기록" (AppTest는 파일 업로드를 흉내 내지 못해 사진 분석은 API 쪽에서만 잽니다)
+# - app_chat          : app.py 탭 4 상담, 쌓인 대화 길이별 (--chat-turns)
+# - app_report        : app.py 탭 3 보고서 세 종류, 저장된 식단 기록 수별 (--diet-logs)
+# - 모델: stub(가짜, --model-latency만큼 기다림) 또는 replay(녹화해 둔 응답 --replay-file, --record면 없는 응답을 녹화)
+#   기본 녹화 파일(benchmarks/fixtures/e2e_replay.jsonl)은 기본 인자로 --record --record-from stub 해서 만든 것입니다.
+#   응답은 요청 내용(전처리한 사진 바이트 포함)으로 찾으므로, 인자나 Pillow 버전이 바뀌어 못 찾으면 오류로 세고
+#   실패로 끝납니다. 그때는 --record로 다시 녹화하세요.
+#   저장소: Firestore 대신 임시 폴더의 SQLite (STORAGE_BACKEND=sqlite)
+# - 시나리오(+ 파라미터)마다 새 프로세스에서 돌립니다. peak RSS는 프로세스 전체의 최댓값이라 섞이지 않게 하려는 것입니다.
+#   시험용 사진은 부모 프로세스에서 파일로 만들어 두고 자식은 읽기만 합니다. (사진 생성 메모리가 RSS에 섞이지 않게)
+# - 결과: 처리량(req/s), 지연 p50/p95/p99, peak RSS(와 준비 후 늘어난 양), 구간(span)별 평균 시간 → JSON
+#   오류가 하나라도 난 시나리오는 실패로 보고 기준 비교에서 뺍니다 (종료 코드 1).
+#   --baseline을 주면 같은 시나리오끼리 비교해서 tolerance보다 나빠진 항목을 알려 주고 종료 코드 1로 끝납니다.
+#   (화면 흐름은 한 세션에서 차례로 재므로 처리량 = 횟수 / 잰 시간의 합입니다)
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "app.py")
+sys.path.insert(0, ROOT)
+
+SCENARIOS = ["api_greeting", "api_analyze_food", "app_greeting", "app_dish_name", "app_chat", "app_report"]
+REPORT_TYPES = ["일간 분석", "최근 추이", "주간 추이"]
+
+
+def int_list(text):
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+# --- 측정 도우미 ---
+def peak_rss_mb():
+    import resource
+
+    # 리눅스의 ru_maxrss는 fork / exec 전 부모의 최댓값까지 이어받으므로, 이 프로세스만의 값(VmHWM)을 씁니다.
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    # macOS는 바이트, 그 밖은 KB 단위입니다.
+    scale = 1 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1024 / 1024, 1)
+
+
+def span_summary():
+    import metrics
+
+    spans = {}
+    for key, entry in metrics.snapshot()["observations"].items():
+        match = re.fullmatch(r'span_seconds\{span="(.+)"\}', key)
+        if match:
+            spans[match.group(1)] = {"count": entry["count"], "avg_ms": round(entry["avg"] * 1000, 2),
+                                     "max_ms": round(entry["max"] * 1000, 2)}
+    return spans
+
+
+def summarize(samples, wall_seconds, errors, setup_rss, extra=None):
+    import numpy as np
+
+    latencies = np.array(samples) * 1000 if samples else np.zeros(1)
+    peak_rss = peak_rss_mb()
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(len(samples) / wall_seconds, 2) if wall_seconds else 0.0,
+        "latency_ms": {
+            "p50": round(float(np.percentile(latencies, 50)), 2),
+            "p95": round(float(np.percentile(latencies, 95)), 2),
+            "p99": round(float(np.percentile(latencies, 99)), 2),
+            "mean": round(float(latencies.mean()), 2),
+            "max": round(float(latencies.max()), 2),
+        },
+        "setup_rss_mb": setup_rss,
+        "peak_rss_mb": peak_rss,
+        "rss_growth_mb": round(peak_rss - setup_rss, 1),
+        "spans": span_summary(),
+        "extra": extra or {},
+    }
+
+
+# --- 가짜 음식 사진: 그라데이션 + 무작위 도형 (seed가 같으면 같은 사진) ---
+def make_photo(edge, seed):
+    import io
+
+    import numpy as np
+    import PIL.Image
+    import PIL.ImageDraw
+
+    rng = np.random.default_rng(seed)
+    width, height = edge, edge * 3 // 4
+    base = rng.integers(40, 200, size=3)
+    ramp = np.linspace(0, 55, width, dtype=np.float32)[None, :, None]
+    pixels = np.clip(base[None, None, :] + ramp + np.zeros((height, 1, 1), np.float32), 0, 255).astype(np.uint8)
+    img = PIL.Image.fromarray(pixels, "RGB")
+    draw = PIL.ImageDraw.Draw(img)
+    for _ in range(12):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        r = int(rng.integers(edge // 20, edge // 5))
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=tuple(int(c) for c in rng.integers(0, 255, size=3)))
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=90)
+    return out.getvalue()
+
+
+def photo_path(photo_dir, seed):
+    return os.path.join(photo_dir, f"photo{seed}.jpg")
+
+
+def write_photos(photo_dir, edge, count):
+    os.makedirs(photo_dir, exist_ok=True)
+    for seed in range(count):
+        with open(photo_path(photo_dir, seed), "wb") as f:
+            f.write(make_photo(edge, seed))
+
+
+def read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+# --- API 시나리오: 동시에 concurrency개씩 ---
+def run_api(scenario, params, args):
+    import httpx
+
+    import main as server
+
+    n = args.requests
+    photos = []
+    if scenario == "api_analyze_food":
+        photos = [read_bytes(photo_path(args.photo_dir, seed)) for seed in range(args.warmup + n)]
+
+    def send(client, i):
+        nickname = f"bench{i}"
+        if scenario == "api_greeting":
+            profile = {"nickname": nickname, "height": 160, "weight": 55, "goals": ["혈당 관리"]}
+            return client.post("/api/v1/greeting", json=profile)
+        return client.post(
+            "/api/v1/analyze_food",
+            files={"file": (f"photo{i}.jpg", photos[i], "image/jpeg")}, data={"nickname": nickname},
+        )
+
+    samples, statuses, sources = [], Counter(), Counter()
+
+    async def drive():
+        transport = httpx.ASGITransport(app=server.app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            for i in range(args.warmup):
+                await send(client, i)
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def one(i):
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await send(client, i)
+                    samples.append(time.perf_counter() - start)
+                    statuses[response.status_code] += 1
+                    if response.status_code == 200 and "source" in response.json():
+                        sources[response.json()["source"]] += 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(args.warmup, args.warmup + n)))
+            return time.perf_counter() - start
+
+    setup_rss = peak_rss_mb()
+    wall = asyncio.run(drive())
+    extra = {"statuses": dict(statuses), "concurrency": args.concurrency}
+    if photos:
+        extra["photo_kb_avg"] = round(sum(len(p) for p in photos) / len(photos) / 1024, 1)
+        extra["sources"] = dict(sources)
+    errors = sum(count for status, count in statuses.items() if status != 200)
+    return summarize(samples, wall, errors, setup_rss, extra)
+
+
+# --- 화면 시나리오 (Streamlit AppTest) ---
+def new_app(args, nickname="bench"):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=args.app_timeout)
+    at.session_state["user_info"] = {"nickname": nickname, "age": 72, "gender": "여성", "height": 155, "weight": 52}
+    return at
+
+
+def app_failed(at):
+    return bool(at.exception) or bool(at.error)
+
+
+def seed_diet_logs(nickname, count):
+    from clients import get_repo
+    from food_index import get_food_index
+    from nutrition import build_log_data
+
+    foods = list(get_food_index().foods.values())
+    repo = get_repo()
+    now = datetime.now()
+    today = date.today()
+    logs = []
+    for i in range(count):
+        day = today - timedelta(days=i % 30)
+        record_time = datetime.combine(day, now.time())
+        logs.append(build_log_data(foods[i % len(foods)], day, record_time, ["아침", "점심", "저녁"][i % 3], now))
+    for i in range(0, len(logs), 500):
+        repo.add_diet_logs(nickname, logs[i:i + 500])
+
+
+def seed_chat(turns):
+    from chat_context import ChatContext
+
+    history, context = [], ChatContext()
+    for i in range(turns):
+        role = "user" if i % 2 == 0 else "model"
+        text = f"{i}번째 대화: 오늘 점심으로 된장찌개와 잡곡밥을 먹었는데 나트륨이 걱정돼요. 국물은 얼마나 먹어도 될까요?"
+        history.append({"role": role, "text": text})
+        context.add(role, text)
+    return history[-100:], context
+
+
+def run_app(scenario, params, args):
+    samples, errors, extra = [], 0, {}
+
+    def timed(action):
+        start = time.perf_counter()
+        at = action()
+        samples.append(time.perf_counter() - start)
+        return at
+
+    if scenario == "app_report":
+        seed_diet_logs("bench", params["diet_logs"])
+        setup_rss = peak_rss_mb()
+        per_type = {label: [] for label in REPORT_TYPES}
+        for _ in range(args.requests):
+            # 새 세션마다 조회 캐시가 비어 있으므로 매번 저장소에서 읽습니다.
+            at = new_app(args)
+            for label in REPORT_TYPES:
+                if label == REPORT_TYPES[0]:
+                    at = timed(at.run)
+                else:
+                    at = timed(at.radio[0].set_value(label).run)
+                per_type[label].append(samples[-1] * 1000)
+                errors += app_failed(at)
+        extra["p50_ms_by_report"] = {label: round(sorted(v)[len(v) // 2], 2) for label, v in per_type.items()}
+    elif scenario == "app_chat":
+        setup_rss = peak_rss_mb()
+        for i in range(args.warmup + args.requests):
+            # 질문할 때마다 대화가 늘어나므로 매번 같은 길이의 대화로 새로 시작합니다.
+            history, context = seed_chat(params["chat_turns"])
+            at = new_app(args)
+            at.session_state["chat_history"] = list(history)
+            at.session_state["chat_context"] = context
+            at.run()
+            if i < args.warmup:
+                at.chat_input[0].set_value("국물은 얼마나 먹어도 될까요?").run()
+                continue
+            at = timed(at.chat_input[0].set_value("국물은 얼마나 먹어도 될까요?").run)
+            errors += app_failed(at)
+    else:
+        at = new_app(args)
+        at.run()
+        setup_rss = peak_rss_mb()
+        dishes = ["김치찌개", "된장찌개", "비빔밥", "불고기", "잡채"]
+        for i in range(args.warmup + args.requests):
+            if scenario == "app_greeting":
+                action = [b for b in at.button if "인사" in b.label][0].click().run
+            else:
+                at.session_state["chat_history"] = []
+                # 이름을 넣어야 "이름으로 기록" 버튼이 나타납니다. (이 실행은 재지 않습니다)
+                at = [t for t in at.text_input if "음식 이름" in t.label][0].set_value(dishes[i % len(dishes)]).run()
+                action = [b for b in at.button if "이름으로" in b.label][0].click().run
+            if i < args.warmup:
+                at = action()
+                continue
+            at = timed(action)
+            errors += app_failed(at)
+
+    return summarize(samples, sum(samples), errors, setup_rss, extra)
+
+
+def run_case(case):
+    args = argparse.Namespace(**case["args"], photo_dir=case["photo_dir"])
+    import metrics
+
+    metrics.setup_logging()
+    if case["scenario"].startswith("api_"):
+        result = run_api(case["scenario"], case["params"], args)
+    else:
+        result = run_app(case["scenario"], case["params"], args)
+    with open(case["out"], "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False)
+
+
+# --- 부모 프로세스: 시나리오마다 새 프로세스 ---
+def build_cases(args):
+    wanted = [s.strip() for s in args.scenarios.split(",")] if args.scenarios else SCENARIOS
+    cases = []
+    for scenario in wanted:
+        if scenario == "api_analyze_food":
+            cases += [(scenario, {"image_edge": edge}) for edge in int_list(args.image_edges)]
+        elif scenario == "app_chat":
+            cases += [(scenario, {"chat_turns": turns}) for turns in int_list(args.chat_turns)]
+        elif scenario == "app_report":
+            cases += [(scenario, {"diet_logs": count}) for count in int_list(args.diet_logs)]
+        elif scenario in SCENARIOS:
+            cases.append((scenario, {}))
+        else:
+            raise SystemExit(f"알 수 없는 시나리오: {scenario} (가능: {', '.join(SCENARIOS)})")
+    return cases
+
+
+def case_env(args, tmp):
+    env = dict(os.environ)
+    env.update({
+        "MODEL_BACKEND": args.model,
+        "MODEL_STUB_LATENCY": str(args.model_latency),
+        "MODEL_STUB_ERROR_RATE": "0",
+        "STORAGE_BACKEND": "sqlite",
+        "STORAGE_SQLITE_PATH": os.path.join(tmp, "bench.sqlite3"),
+        "WRITE_SPOOL_PATH": os.path.join(tmp, "spool.sqlite3"),
+        "ANALYSIS_CACHE_DIR": "",
+        "WARMUP": "0",
+        # 한도 / 대기열은 gateway_load.py에서 따로 잽니다. 여기서는 처리 경로의 속도만 봅니다.
+        "MODEL_RATE_PER_KEY": "0",
+        "MODEL_RATE_PER_USER": "0",
+        "MODEL_MAX_QUEUE": "100000",
+        "LOG_LEVEL": "WARNING",
+        "PROFILING_ENABLED": "0",
+    })
+    if args.model == "replay":
+        os.makedirs(os.path.dirname(os.path.abspath(args.replay_file)), exist_ok=True)
+        env["MODEL_REPLAY_FILE"] = os.path.abspath(args.replay_file)
+        env["MODEL_REPLAY_RECORD"] = "1" if args.record else "0"
+        env["MODEL_REPLAY_SOURCE"] = args.record_from
+    return env
+
+
+def case_label(scenario, params):
+    return scenario + "".join(f" {k}={v}" for k, v in params.items())
+
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {case_label(r["scenario"], r["params"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        label = case_label(result["scenario"], result["params"])
+        old = baseline.get(label)
+        if old is None or old.get("failed"):
+            continue
+        checks = [
+            ("p95", result["latency_ms"]["p95"], old["latency_ms"]["p95"], True),
+            ("throughput", result["throughput_rps"], old["throughput_rps"], False),
+            ("peak_rss", result["peak_rss_mb"], old["peak_rss_mb"], True),
+        ]
+        for name, new_value, old_value, lower_is_better in checks:
+            if not old_value:
+                continue
+            change = (new_value - old_value) / old_value
+            if (change > tolerance) if lower_is_better else (change < -tolerance):
+                regressions.append(f"{label}: {name} {old_value} → {new_value} ({change:+.0%})")
+    return regressions
+
+
+def main(args):
+    cases = build_cases(args)
+    results = []
+    for scenario, params in cases:
+        label = case_label(scenario, params)
+        with tempfile.TemporaryDirectory() as tmp:
+            out = os.path.join(tmp, "result.json")
+            photo_dir = os.path.join(tmp, "photos")
+            if scenario == "api_analyze_food":
+                write_photos(photo_dir, params["image_edge"], args.warmup + args.requests)
+            case = {"scenario": scenario, "params": params, "out": out, "args": vars(args), "photo_dir": photo_dir}
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run-case", json.dumps(case, ensure_ascii=False)],
+                env=case_env(args, tmp), cwd=tmp, capture_output=True, text=True,
+            )
+            if proc.returncode != 0 or not os.path.exists(out):
+                print(f"❌ {label} 실패\n{proc.stderr[-3000:]}")
+                results.append({"scenario": scenario, "params": params, "failed": True})
+                continue
+            with open(out, encoding="utf-8") as f:
+                result = {"scenario": scenario, "params": params, **json.load(f)}
+        # 오류 응답은 정상 경로보다 훨씬 빨리 끝나서 처리량 / 지연이 좋아 보이므로, 오류가 있으면 실패로 봅니다.
+        result["failed"] = result["errors"] > 0
+        results.append(result)
+        latency = result["latency_ms"]
+        print(f"{'❌ ' if result['failed'] else ''}{label:<32} {result['throughput_rps']:8.1f} req/s  "
+              f"p50 {latency['p50']:7.1f}ms  p95 {latency['p95']:7.1f}ms  p99 {latency['p99']:7.1f}ms  "
+              f"RSS {result['peak_rss_mb']:6.1f}MB (+{result['rss_growth_mb']:.1f})"
+              + (f"  오류 {result['errors']}" if result["errors"] else ""))
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "commit": commit,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    out = args.out or os.path.join(ROOT, "benchmarks", "results", f"e2e-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"✅ 결과를 {out}에 저장했습니다.")
+
+    failed = [r for r in results if r.get("failed")]
+    for result in failed:
+        print(f"❌ 실패: {case_label(result['scenario'], result['params'])}")
+    if args.baseline:
+        regressions = compare([r for r in results if not r.get("failed")], args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"⚠️ 느려짐: {line}")
+        if not regressions:
+            print(f"👍 기준({args.baseline}) 대비 {args.tolerance:.0%} 넘게 나빠진 항목이 없습니다.")
+        if regressions:
+            return 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", default="", help=f"쉼표로 구분 (기본: 전부) {','.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=30, help="시나리오마다 재는 횟수")
+    parser.add_argument("--warmup", type=int, default=3, help="재기 전에 버리는 횟수")
+    parser.add_argument("--concurrency", type=int, default=8, help="API 시나리오의 동시 요청 수")
+    parser.add_argument("--image-edges", default="640,1600,4000", help="사진 긴 변 길이(px) 목록")
+    parser.add_argument("--chat-turns", default="0,20,200", help="쌓인 대화 수 목록")
+    parser.add_argument("--diet-logs", default="0,300,3000", help="저장된 식단 기록 수 목록 (최근 30일에 나눠 담음)")
+    parser.add_argument("--model", choices=["stub", "replay"], default="stub")
+    parser.add_argument("--model-latency", type=float, default=0.0, help="stub 모델 지연(초)")
+    parser.add_argument("--replay-file", default=os.path.join(ROOT, "benchmarks", "fixtures", "e2e_replay.jsonl"))
+    parser.add_argument("--record", action="store_true", help="replay 파일에 없는 응답을 받아 녹화")
+    parser.add_argument("--record-from", choices=["gemini", "stub"], default="gemini",
+                        help="--record 때 응답을 받을 모델 (gemini는 GOOGLE_API_KEY 필요)")
+    parser.add_argument("--app-timeout", type=float, default=60)
+    parser.add_argument("--out", default="", help="결과 JSON 경로 (기본: benchmarks/results/e2e-날짜.json)")
+    parser.add_argument("--baseline", default="", help="비교할 이전 결과 JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="이 비율보다 나빠지면 회귀로 봅니다")
+    parser.add_argument("--run-case", default="", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        run_case(json.loads(args.run_case))
+    else:
+        sys.exit(main(args))
@@ -0,0 +1,89 @@
+# benchmarks/gateway_load.py (게이트웨이 한도 / 합치기 / 재시도를 가짜 모델로 부하 시험)
+# 실행: python benchmarks/gateway_load.py --users 40 --burst 5 --distinct 2 --latency 0.3 --error-rate 0.1
+# - main.py의 /api/v1/greeting을 프로세스 안에서(httpx ASGITransport) 한꺼번에 부릅니다.
+# - 사용자마다 burst개를 동시에 보내고, 그중 distinct가지만 서로 다른 내용입니다 (나머지는 똑같은 요청 → 합치기 대상).
+# - 상태 코드별 개수, 실제 모델 호출 수, 합친 수, 재시도 수, 지연 시간 분포를 출력합니다.
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def main(args):
+    import httpx
+
+    import main as server
+    import metrics
+
+    transport = httpx.ASGITransport(app=server.app)
+    statuses, latencies, retry_afters = Counter(), [], []
+
+    async def call(client, user, i):
+        profile = {"nickname": f"user{user}", "height": 160, "weight": 55, "goals": [f"목표{i % args.distinct}"]}
+        start = time.perf_counter()
+        response = await client.post("/api/v1/greeting", json=profile)
+        latencies.append(time.perf_counter() - start)
+        statuses[response.status_code] += 1
+        if response.status_code in (429, 503):
+            retry_afters.append(int(response.headers["Retry-After"]))
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(call(client, u, i) for u in range(args.users) for i in range(args.burst)))
+        elapsed = time.perf_counter() - start
+
+    counters = metrics.snapshot()["counters"]
+    total = args.users * args.burst
+    print(f"요청 {total}개 (사용자 {args.users}명 × {args.burst}개, 서로 다른 내용 {args.distinct}가지) → {elapsed:.2f}s")
+    print(f"  상태 코드: {dict(sorted(statuses.items()))}")
+    print(f"  모델 호출 {counters.get('gateway_calls', 0)}회, 합침 {counters.get('gateway_coalesced', 0)}회, "
+          f"재시도 {counters.get('gateway_retries', 0)}회, 재시도 후 실패 {counters.get('gateway_unavailable', 0)}회")
+    print(f"  거절: 사용자 한도 {counters.get('gateway_rejected_user', 0)}, 대기열 {counters.get('gateway_rejected_queue', 0)}, "
+          f"API 키 한도 {counters.get('gateway_rejected_rate', 0)}")
+    if retry_afters:
+        print(f"  Retry-After: 최소 {min(retry_afters)}s, 최대 {max(retry_afters)}s")
+    print(f"  지연 p50 {percentile(latencies, 0.5) * 1000:.0f}ms, p95 {percentile(latencies, 0.95) * 1000:.0f}ms, "
+          f"최대 {max(latencies) * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--burst", type=int, default=5, help="사용자마다 동시에 보내는 요청 수")
+    parser.add_argument("--distinct", type=int, default=2, help="burst 중 서로 다른 내용의 수")
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--queue", type=int, default=32)
+    parser.add_argument("--key-rate", type=float, default=20)
+    parser.add_argument("--user-rate", type=float, default=0.5)
+    args = parser.parse_args()
+
+    # main.py를 불러오기 전에 가짜 모델 / 로컬 저장소 / 게이트웨이 설정을 정합니다.
+    tmp = tempfile.mkdtemp()
+    os.environ.update({
+        "MODEL_BACKEND": "stub",
+        "MODEL_STUB_LATENCY": str(args.latency),
+        "MODEL_STUB_ERROR_RATE": str(args.error_rate),
+        "MODEL_MAX_CONCURRENCY": str(args.concurrency),
+        "MODEL_MAX_QUEUE": str(args.queue),
+        "MODEL_RATE_PER_KEY": str(args.key_rate),
+        "MODEL_RATE_PER_USER": str(args.user_rate),
+        "STORAGE_BACKEND": "sqlite",
+        "STORAGE_SQLITE_PATH": os.path.join(tmp, "bench.sqlite3"),
+        "WRITE_SPOOL_PATH": os.path.join(tmp, "spool.sqlite3"),
+        "WARMUP": "0",
+    })
+    asyncio.run(main(args))
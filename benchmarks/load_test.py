@@ -0,0 +1,71 @@
+# benchmarks/load_test.py (이벤트 루프 블로킹 vs 게이트웨이 처리량 비교)
+# 실행: python benchmarks/load_test.py --requests 100 --latency 0.2 --concurrency 16
+# - 실제 Gemini 대신 지연 시간만 흉내 내는 가짜 모델을 씁니다.
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_gateway import ModelGateway  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeSyncModel:
+    # generate_content만 있는 모델 (스레드 풀 경로)
+    def __init__(self, latency):
+        self.latency = latency
+
+    def generate_content(self, contents, **kwargs):
+        time.sleep(self.latency)
+        return FakeResponse("안녕하세요!")
+
+
+class FakeAsyncModel(FakeSyncModel):
+    # generate_content_async가 있는 모델 (비동기 경로)
+    async def generate_content_async(self, contents, **kwargs):
+        await asyncio.sleep(self.latency)
+        return FakeResponse("안녕하세요!")
+
+
+async def run(handler, n_requests):
+    start = time.perf_counter()
+    await asyncio.gather(*(handler(i) for i in range(n_requests)))
+    return time.perf_counter() - start
+
+
+async def main(args):
+    sync_model = FakeSyncModel(args.latency)
+    async_model = FakeAsyncModel(args.latency)
+    gateway = ModelGateway(max_concurrency=args.concurrency, timeout=args.latency * 10 + 5)
+
+    # 1) 기존 방식: async def 안에서 동기 호출 → 요청이 하나씩 처리됨
+    async def blocking_handler(i):
+        return sync_model.generate_content(f"prompt {i}").text
+
+    # 2) 게이트웨이 + 스레드 풀
+    async def threaded_handler(i):
+        return (await gateway.generate(sync_model, f"prompt {i}")).text
+
+    # 3) 게이트웨이 + 비동기 API
+    async def async_handler(i):
+        return (await gateway.generate(async_model, f"prompt {i}")).text
+
+    print(f"요청 {args.requests}개, 모델 지연 {args.latency}s, 동시 호출 제한 {args.concurrency}")
+    for name, handler in [("blocking", blocking_handler), ("gateway-thread", threaded_handler), ("gateway-async", async_handler)]:
+        elapsed = await run(handler, args.requests)
+        print(f"{name:>15}: {elapsed:7.2f}s  ({args.requests / elapsed:7.1f} req/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--concurrency", type=int, default=16)
+    asyncio.run(main(parser.parse_args()))
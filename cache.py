@@ -0,0 +1,206 @@
+# cache.py (AI 분석 결과 캐시)
+# - 같은 사진 + 같은 프롬프트 + 같은 모델이면 Gemini를 다시 부르지 않습니다.
+# - 1단계: 프로세스 메모리 LRU / 2단계(선택): 디스크 (용량·유효기간 기준 정리)
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+
+# --- 캐시 키 만들기: 이미지 바이트 + 프롬프트 + 모델 이름의 해시 ---
+def make_key(image_bytes, prompt, model_name):
+    h = hashlib.sha256()
+    for part in (model_name.encode("utf-8"), prompt.encode("utf-8"), image_bytes):
+        # 길이를 앞에 붙여서 경계가 섞이지 않도록 합니다.
+        h.update(len(part).to_bytes(8, "big"))
+        h.update(part)
+    return h.hexdigest()
+
+
+class AnalysisCache:
+    def __init__(self, max_items=256, ttl_seconds=7 * 24 * 3600, disk_dir=None, disk_max_bytes=50 * 1024 * 1024):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()  # key -> (저장 시각, 응답 텍스트)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _expired(self, created):
+        return self.ttl_seconds and (time.time() - created) > self.ttl_seconds
+
+    # --- 조회 ---
+    def get(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[0]):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    metrics.inc("analysis_cache_hits")
+                    return entry[1]
+                del self._memory[key]
+
+        entry = self._disk_get(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                metrics.inc("analysis_cache_misses")
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            metrics.inc("analysis_cache_hits")
+            self._memory_put(key, entry)
+            return entry[1]
+
+    # --- 저장 ---
+    def set(self, key, text):
+        entry = (time.time(), text)
+        with self._lock:
+            self._memory_put(key, entry)
+        self._disk_put(key, entry)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "memory_items": len(self._memory),
+            }
+
+    def _memory_put(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    # --- 디스크 단계 ---
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self._expired(data["created"]):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return (data["created"], data["text"])
+
+    def _disk_put(self, key, entry):
+        if not self.disk_dir:
+            return
+        tmp_path = self._disk_path(key) + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"created": entry[0], "text": entry[1]}, f, ensure_ascii=False)
+            os.replace(tmp_path, self._disk_path(key))
+        except OSError:
+            return
+        self._disk_evict()
+
+    def _disk_evict(self):
+        # 유효기간이 지난 파일을 먼저 지우고, 그래도 용량을 넘으면 오래된 순서로 지웁니다.
+        files = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.disk_dir, name)
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+            if self._expired(info.st_mtime):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            files.append((info.st_mtime, info.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+# --- 공용 캐시 (app.py / main.py가 함께 사용) ---
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnalysisCache(
+                max_items=int(os.environ.get("ANALYSIS_CACHE_SIZE", "256")),
+                ttl_seconds=int(os.environ.get("ANALYSIS_CACHE_TTL", str(7 * 24 * 3600))),
+                disk_dir=os.environ.get("ANALYSIS_CACHE_DIR") or None,
+                disk_max_bytes=int(os.environ.get("ANALYSIS_CACHE_MAX_MB", "50")) * 1024 * 1024,
+            )
+        return _cache
+
+
+# --- Firestore 조회 캐시 (Streamlit 세션마다 하나) ---
+# 키는 (닉네임, 조회 종류, ...) 튜플입니다. 쓰기가 일어나면 해당 앞부분(prefix)만 정확히 지웁니다.
+class QueryCache:
+    def __init__(self, ttl_seconds=300):
+        self.ttl_seconds = ttl_seconds
+        self._entries = {}  # key -> (만료 시각, 값)
+        self.hits = 0
+        self.misses = 0
+
+    # store=False: 아직 저장 대기 중인 쓰기가 있을 때처럼, 읽기는 하되 캐시에 남기지 않습니다.
+    def get_or_load(self, key, loader, store=True):
+        entry = self._entries.get(key)
+        if store and entry is not None and entry[0] > time.time():
+            self.hits += 1
+            metrics.inc("query_cache_hits")
+            return entry[1]
+        self.misses += 1
+        metrics.inc("query_cache_misses")
+        value = loader()
+        if store:
+            self._entries[key] = (time.time() + self.ttl_seconds, value)
+        else:
+            self._entries.pop(key, None)
+        return value
+
+    def invalidate(self, *prefix):
+        for key in [k for k in self._entries if k[:len(prefix)] == prefix]:
+            del self._entries[key]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "entries": len(self._entries),
+        }
@@ -0,0 +1,159 @@
+# chat_context.py (상담 대화 맥락 관리)
+# - 최근 N개의 대화만 그대로 넣고, 그보다 오래된 대화는 요약문 하나로 접습니다.
+# - 요약은 오래된 대화가 일정 개수 쌓이면 백그라운드 스레드에서 만들어, 사용자의 응답 시간을 늘리지 않습니다.
+# - 탭2에서 추가한 식단 기록은 고정(pin)해서 요약으로 사라지지 않게 합니다.
+# - 전체 길이는 토큰 추정치 기준 예산 안으로 자릅니다.
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+KEEP_TURNS = int(os.environ.get("CHAT_KEEP_TURNS", "8"))
+SUMMARIZE_THRESHOLD = int(os.environ.get("CHAT_SUMMARIZE_THRESHOLD", "6"))
+TOKEN_BUDGET = int(os.environ.get("CHAT_TOKEN_BUDGET", "1500"))
+MAX_PINNED = int(os.environ.get("CHAT_MAX_PINNED", "10"))
+# 요약이 계속 실패해도 기다리는 대화가 끝없이 쌓이지 않게: 넘치는 오래된 대화는 짧게 줄여 요약문 뒤에 붙입니다.
+MAX_PENDING = int(os.environ.get("CHAT_MAX_PENDING", "40"))
+FOLDED_TURN_CHARS = 60
+MAX_SUMMARY_CHARS = 1200
+# 요약 호출이 이 시간(초) 안에 끝나지 않으면 포기하고 그 대화를 다시 기다리는 쪽으로 돌립니다.
+SUMMARY_TIMEOUT = float(os.environ.get("CHAT_SUMMARY_TIMEOUT", "30"))
+
+_summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-summary")
+
+_WIDE_CHARS = re.compile(r"[\u1100-\u11ff\u3040-\u30ff\u3130-\u318f\u4e00-\u9fff\uac00-\ud7af]")
+
+
+# --- 토큰 수 추정: 한글/한자는 글자당 약 1토큰, 나머지는 4글자당 약 1토큰 ---
+def estimate_tokens(text):
+    wide = len(_WIDE_CHARS.findall(text))
+    return wide + (len(text) - wide + 3) // 4
+
+
+def format_turn(message):
+    return f"{message['role']}: {message['text']}"
+
+
+def summary_prompt(summary, turns):
+    lines = "\n".join(format_turn(m) for m in turns)
+    return f"""
+    아래는 시니어 영양 상담 대화입니다. 기존 요약과 새 대화를 합쳐 5문장 이내로 요약하세요.
+    사용자의 건강 상태, 고민, 영양사가 한 핵심 조언을 꼭 남기세요.
+
+    [기존 요약]
+    {summary or "(없음)"}
+
+    [새 대화]
+    {lines}
+    """
+
+
+class ChatContext:
+    def __init__(self, keep_turns=KEEP_TURNS, summarize_threshold=SUMMARIZE_THRESHOLD,
+                 token_budget=TOKEN_BUDGET, max_pinned=MAX_PINNED, max_pending=MAX_PENDING,
+                 summary_timeout=SUMMARY_TIMEOUT):
+        self.keep_turns = keep_turns
+        self.summarize_threshold = summarize_threshold
+        self.token_budget = token_budget
+        self.max_pinned = max_pinned
+        self.max_pending = max_pending
+        self.summary_timeout = summary_timeout
+        self.summary = ""
+        self.pinned = []      # 식단 기록 (요약하지 않고 유지)
+        self.recent = []      # 최근 대화 (그대로 유지)
+        self.pending = []     # 요약을 기다리는 오래된 대화
+        self._inflight = []   # 지금 요약 중인 대화
+        self._folded = []     # 요약 중에 요약문 뒤에 접어 붙인 대화 (새 요약에 이어 붙입니다)
+        self._future = None
+        self._started = 0.0
+
+    def add(self, role, text, pinned=False):
+        if pinned:
+            self.pinned.append(text)
+            del self.pinned[:-self.max_pinned]
+            return
+        self.recent.append({"role": role, "text": text})
+        while len(self.recent) > self.keep_turns:
+            self.pending.append(self.recent.pop(0))
+        self._cap_pending()
+
+    # 요약 모델 없이 접기: 넘치는 오래된 대화를 한 줄씩 잘라 요약문 뒤에 붙이고, 요약문은 최근 쪽을 남깁니다.
+    def _cap_pending(self):
+        overflow = len(self.pending) - self.max_pending
+        if overflow <= 0:
+            return
+        folded = " / ".join(format_turn(m)[:FOLDED_TURN_CHARS] for m in self.pending[:overflow])
+        del self.pending[:overflow]
+        self.summary = self._append_summary(self.summary, folded)
+        if self._future is not None:
+            self._folded.append(folded)
+
+    @staticmethod
+    def _append_summary(summary, *tails):
+        return " / ".join([summary, *tails]).strip(" /")[-MAX_SUMMARY_CHARS:]
+
+    # --- 오래된 대화가 쌓였으면 백그라운드에서 요약 (generate_fn: 프롬프트 → 문자열) ---
+    # generate_fn에도 제한 시간을 걸어 주세요. 여기서는 늦은 결과를 기다리지 않을 뿐, 호출 자체를 멈추지는 못합니다.
+    def maybe_summarize(self, generate_fn):
+        future = self._future
+        timed_out = future is not None and not future.done() and time.monotonic() - self._started > self.summary_timeout
+        if future is not None and (future.done() or timed_out):
+            inflight, folded = self._inflight, self._folded
+            self._inflight, self._folded, self._future = [], [], None
+            try:
+                if timed_out:
+                    future.cancel()
+                    raise TimeoutError("요약 시간 초과")
+                # 요약하는 동안 접어 붙인 대화는 새 요약 뒤에 다시 붙입니다. (덮어써서 잃지 않도록)
+                self.summary = self._append_summary(future.result().strip(), *folded)
+            except Exception:
+                # 실패하면 다음 기회에 다시 요약합니다. (접어 붙인 대화는 이미 요약문에 있습니다)
+                self.pending = inflight + self.pending
+                self._cap_pending()
+
+        if self._future is None and len(self.pending) >= self.summarize_threshold:
+            self._inflight, self.pending = self.pending, []
+            self._started = time.monotonic()
+            self._future = _summary_executor.submit(generate_fn, summary_prompt(self.summary, self._inflight))
+
+    # --- 프롬프트에 넣을 대화 내용 (토큰 예산 안으로) ---
+    def build_history(self):
+        turns = [format_turn(m) for m in self._inflight + self.pending + self.recent]
+        pinned = list(self.pinned)
+        summary = self.summary
+
+        def render():
+            parts = []
+            if summary:
+                parts.append(f"[이전 대화 요약]\n{summary}")
+            if pinned:
+                parts.append("[기록된 식단]\n" + "\n".join(pinned))
+            if turns:
+                parts.append("[최근 대화]\n" + "\n".join(turns))
+            return "\n\n".join(parts)
+
+        # 예산을 넘으면 오래된 대화 → 오래된 식단 기록 → 요약 순서로 줄입니다.
+        text = render()
+        if estimate_tokens(text) > self.token_budget and len(turns) > 1:
+            # 대화는 최신부터 거꾸로 토큰 수를 한 번씩만 더해서 예산 안에 드는 만큼 남깁니다. (최소 1개)
+            turns, all_turns = [], turns
+            used = estimate_tokens(render()) + estimate_tokens("[최근 대화]\n")
+            for turn in reversed(all_turns):
+                cost = estimate_tokens(turn) + 1
+                if turns and used + cost > self.token_budget:
+                    break
+                turns.append(turn)
+                used += cost
+            turns.reverse()
+            text = render()
+        while estimate_tokens(text) > self.token_budget:
+            if len(turns) > 1:
+                turns.pop(0)
+            elif len(pinned) > 1:
+                pinned.pop(0)
+            elif summary:
+                summary = summary[: len(summary) // 2]
+            else:
+                break
+            text = render()
+        return text
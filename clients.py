@@ -0,0 +1,128 @@
+# clients.py (모델 / Firestore 연결 / 저장소를 처음 쓸 때 만드는 공용 객체)
+# - import 시점에는 아무것도 연결하지 않습니다. (Cloud Run 콜드 스타트 단축)
+# - 단계별 초기화 시간을 기록해서 부팅 때 한눈에 볼 수 있게 출력합니다.
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+from model_backend import get_backend
+from storage import FirestoreRepository, SQLiteRepository
+
+
+# --- 초기화 단계별 시간 기록 ---
+class StartupTimer:
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+        self._reported = False
+
+    def record(self, name, seconds):
+        with self._lock:
+            if name in self.stages:
+                return
+            self.stages[name] = seconds
+        print(f"⏱️ [startup] {name}: {seconds * 1000:.0f}ms")
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def report(self):
+        with self._lock:
+            if self._reported:
+                return
+            self._reported = True
+            stages = dict(self.stages)
+        total = sum(stages.values())
+        print("⏱️ [startup] 초기화 시간 요약")
+        for name, seconds in sorted(stages.items(), key=lambda kv: -kv[1]):
+            share = seconds / total if total else 0
+            print(f"   {name:<28} {seconds * 1000:8.0f}ms  {share:5.1%}")
+        print(f"   {'합계':<28} {total * 1000:8.0f}ms")
+
+
+startup = StartupTimer()
+
+_lock = threading.Lock()
+_models = {}
+_db = None
+_repo = None
+_db_failed_at = None
+db_error = None
+DB_RETRY_SECONDS = 60
+
+
+# --- 모델: 이름별로 한 번만 만듭니다 (실패하면 fallback 모델로) ---
+def get_model(model_name, fallback=None, api_key=None):
+    with _lock:
+        if model_name not in _models:
+            with startup.stage(f"model:{model_name}"):
+                try:
+                    _models[model_name] = get_backend(model_name, api_key=api_key)
+                except Exception:
+                    if not fallback:
+                        raise
+                    metrics.log("model_fallback", level=logging.WARNING, exc_info=True, model=model_name, fallback=fallback)
+                    _models[model_name] = get_backend(fallback, api_key=api_key)
+        return _models[model_name]
+
+
+# --- Firestore: secrets.json 또는 FIREBASE_KEY 환경 변수로 처음 한 번만 연결 ---
+# 연결할 수 없으면 None을 돌려주고, 이유는 db_error에 남깁니다. (DB_RETRY_SECONDS 뒤에 다시 시도)
+def get_db():
+    global _db, _db_failed_at, db_error
+    with _lock:
+        if _db is not None:
+            return _db
+        if _db_failed_at and time.time() - _db_failed_at < DB_RETRY_SECONDS:
+            return None
+        try:
+            with startup.stage("import:firebase_admin"):
+                import firebase_admin
+                from firebase_admin import credentials, firestore
+
+            with startup.stage("firebase:initialize_app"):
+                if not firebase_admin._apps:
+                    if os.path.exists("secrets.json"):
+                        firebase_admin.initialize_app(credentials.Certificate("secrets.json"))
+                    elif os.environ.get("FIREBASE_KEY"):
+                        cred_dict = json.loads(os.environ["FIREBASE_KEY"])
+                        firebase_admin.initialize_app(credentials.Certificate(cred_dict))
+                    else:
+                        raise RuntimeError("DB 연결 키를 찾을 수 없습니다.")
+
+            with startup.stage("firebase:firestore.client"):
+                _db = firestore.client()
+            db_error = None
+        except Exception as e:
+            _db = None
+            _db_failed_at = time.time()
+            db_error = str(e)
+        return _db
+
+
+# --- 저장소: STORAGE_BACKEND=firestore(기본) | sqlite ---
+# sqlite는 네트워크 없이 로컬 파일(STORAGE_SQLITE_PATH)에 저장합니다. Firestore에 연결할 수 없으면 None.
+def get_repo():
+    global _repo
+    if os.environ.get("STORAGE_BACKEND", "firestore").lower() == "sqlite":
+        with _lock:
+            if _repo is None:
+                with startup.stage("sqlite:open"):
+                    _repo = SQLiteRepository(os.environ.get("STORAGE_SQLITE_PATH", "dundun.sqlite3"))
+            return _repo
+    db = get_db()
+    if db is None:
+        return None
+    with _lock:
+        if _repo is None:
+            _repo = FirestoreRepository(db)
+        return _repo
@@ -0,0 +1,162 @@
+# food_index.py (모델을 부르지 않고 로컬에서 답할 수 있는 음식 찾기)
+# - 음식 이름: data/korean_foods.csv(자주 드시는 한식 1인분 영양 정보)에서 이름/별칭이 정확히 같은 것 → 비슷한 이름 순으로 찾습니다.
+# - 사진: 같은 사용자가 전에 분석한 사진과 거의 같으면(dHash 지문의 다른 비트 수가 적으면) 그때 결과를 다시 씁니다.
+#   (다시 찍은 사진은 바이트가 달라 분석 캐시에는 안 걸리지만 지문은 거의 같습니다)
+# - 로컬에서 답한 비율(local_hit_ratio)을 stats()와 metrics(food_index_*)에 남깁니다.
+import csv
+import difflib
+import io
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import PIL.Image
+
+import metrics
+from nutrition import NUTRIENT_KEYS, to_number
+
+FOODS_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "korean_foods.csv")
+
+_SEPARATORS = re.compile(r"[\s\-_·,.()\[\]]+")
+
+
+def normalize_name(name):
+    return _SEPARATORS.sub("", str(name or "")).lower()
+
+
+# --- 사진 지문 (dHash, 64비트) ---
+# 9x8 흑백으로 줄인 뒤 옆 픽셀보다 밝은지를 비트로 남깁니다. 크기·압축·밝기 차이에 강합니다.
+def dhash(image_bytes, size=8):
+    img = PIL.Image.open(io.BytesIO(image_bytes))
+    img.draft("L", (size * 4, size * 4))
+    pixels = img.convert("L").resize((size + 1, size), PIL.Image.BILINEAR).tobytes()
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            i = row * (size + 1) + col
+            bits = (bits << 1) | (pixels[i] > pixels[i + 1])
+    return bits
+
+
+class FoodIndex:
+    def __init__(self, csv_path=FOODS_CSV, fuzzy_cutoff=0.75, photo_max_distance=6, photos_per_user=200):
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.photo_max_distance = photo_max_distance
+        self.photos_per_user = photos_per_user
+        self.foods = {}  # 대표 이름 → 영양 정보
+        self.names = {}  # 정규화한 이름/별칭 → 대표 이름
+        self._photos = {}  # 닉네임 → OrderedDict(지문 → 결과)
+        self._lock = threading.Lock()
+        self.table_hits = 0
+        self.photo_hits = 0
+        self.misses = 0
+        if csv_path and os.path.exists(csv_path):
+            self._load(csv_path)
+
+    def _load(self, csv_path):
+        with open(csv_path, encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                name = row["food_name"].strip()
+                self.foods[name] = {
+                    "food_name": name,
+                    **{key: to_number(row.get(key)) for key in NUTRIENT_KEYS},
+                    "vitamin_info": row.get("vitamin_info", ""),
+                    "analysis": f"{row.get('serving', '1인분')} 기준 표준 영양 정보입니다.",
+                    "tips": row.get("tips", ""),
+                }
+                for alias in [name, *(row.get("aliases") or "").split("|")]:
+                    if normalize_name(alias):
+                        self.names.setdefault(normalize_name(alias), name)
+
+    # --- 이름으로 찾기: 정확히 같은 이름 → 비슷한 이름 ---
+    def lookup_name(self, name):
+        key = normalize_name(name)
+        if not key:
+            return None
+        canonical = self.names.get(key)
+        if canonical is None:
+            matches = difflib.get_close_matches(key, list(self.names), n=1, cutoff=self.fuzzy_cutoff)
+            if not matches:
+                return None
+            canonical = self.names[matches[0]]
+        return dict(self.foods[canonical])
+
+    # --- 사진으로 찾기: 같은 사용자가 전에 분석한 사진 중 가장 가까운 것 ---
+    def lookup_photo(self, nickname, photo_hash):
+        with self._lock:
+            photos = self._photos.get(nickname)
+            if not photos:
+                return None
+            best, best_distance = None, self.photo_max_distance + 1
+            for known_hash in photos:
+                distance = (known_hash ^ photo_hash).bit_count()
+                if distance < best_distance:
+                    best, best_distance = known_hash, distance
+            if best is None:
+                return None
+            photos.move_to_end(best)
+            return photos[best]
+
+    # --- 이름 → 사진 순서로 찾고 (결과, 출처, 사진 지문)을 돌려줍니다. 못 찾으면 결과는 None ---
+    def find(self, nickname=None, name=None, image_bytes=None):
+        result, source, photo_hash = None, None, None
+        if name:
+            result, source = self.lookup_name(name), "table"
+        if result is None and image_bytes is not None:
+            photo_hash = dhash(image_bytes)
+            if nickname:
+                result, source = self.lookup_photo(nickname, photo_hash), "photo"
+        self._count(source if result is not None else "miss")
+        return result, (source if result is not None else None), photo_hash
+
+    # 모델로 분석한 결과를 사진 지문과 함께 기억합니다. (사용자마다 최근 photos_per_user장)
+    def remember(self, nickname, photo_hash, result):
+        if not nickname or photo_hash is None or result is None:
+            return
+        with self._lock:
+            photos = self._photos.setdefault(nickname, OrderedDict())
+            photos[photo_hash] = result
+            photos.move_to_end(photo_hash)
+            while len(photos) > self.photos_per_user:
+                photos.popitem(last=False)
+
+    def _count(self, source):
+        with self._lock:
+            if source == "table":
+                self.table_hits += 1
+            elif source == "photo":
+                self.photo_hits += 1
+            else:
+                self.misses += 1
+        metrics.inc(f"food_index_{source}")
+
+    def stats(self):
+        with self._lock:
+            local = self.table_hits + self.photo_hits
+            total = local + self.misses
+            return {
+                "foods": len(self.foods),
+                "table_hits": self.table_hits,
+                "photo_hits": self.photo_hits,
+                "misses": self.misses,
+                "local_hit_ratio": local / total if total else 0.0,
+            }
+
+
+# --- 공용 인덱스 (프로세스마다 하나) ---
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_food_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = FoodIndex(
+                csv_path=os.environ.get("FOODS_CSV", FOODS_CSV),
+                fuzzy_cutoff=float(os.environ.get("FOOD_FUZZY_CUTOFF", "0.75")),
+                photo_max_distance=int(os.environ.get("PHOTO_MAX_DISTANCE", "6")),
+                photos_per_user=int(os.environ.get("PHOTO_INDEX_PER_USER", "200")),
+            )
+        return _index
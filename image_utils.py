@@ -0,0 +1,64 @@
+# image_utils.py (Gemini 업로드 전 사진 전처리)
+# - 휴대폰 사진(3~12MB)을 그대로 보내지 않고, 방향 보정 → 축소 → 메타데이터 제거 → 재압축합니다.
+# - JPEG는 draft()로 처음부터 작게 디코딩해서 원본 크기 비트맵을 메모리에 올리지 않습니다.
+import io
+import logging
+import os
+import time
+
+import PIL.Image
+import PIL.ImageOps
+
+import metrics
+
+logger = logging.getLogger("dundun.image_utils")
+
+# 환경 변수로 조정 가능한 기본값
+MAX_EDGE = int(os.environ.get("IMAGE_MAX_EDGE", "1024"))
+OUTPUT_FORMAT = os.environ.get("IMAGE_FORMAT", "JPEG").upper()
+QUALITY = int(os.environ.get("IMAGE_QUALITY", "85"))
+
+_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+# --- 사진 전처리: Gemini에 바로 넣을 수 있는 {"mime_type", "data"} 형태로 돌려줍니다 ---
+# 전체 시간은 span "image_preprocess", 그중 디코딩(열기 + 방향 보정)은 span "image_decode"로 남깁니다.
+@metrics.timed("image_preprocess")
+def preprocess_image(raw_bytes, max_edge=None, fmt=None, quality=None):
+    max_edge = max_edge or MAX_EDGE
+    fmt = (fmt or OUTPUT_FORMAT).upper()
+    quality = quality or QUALITY
+    if fmt not in _MIME_TYPES:
+        fmt = "JPEG"
+
+    t0 = time.perf_counter()
+    img = PIL.Image.open(io.BytesIO(raw_bytes))
+    original_size = img.size
+    # JPEG는 디코딩 단계에서 1/2, 1/4, 1/8로 줄여서 읽습니다 (다른 형식은 무시됨).
+    img.draft("RGB", (max_edge, max_edge))
+    t1 = time.perf_counter()
+
+    # EXIF 방향 정보대로 회전 (이때 실제 디코딩이 일어납니다)
+    img = PIL.ImageOps.exif_transpose(img)
+    t2 = time.perf_counter()
+
+    # reducing_gap: 먼저 reduce()로 정수배 축소 후 남은 부분만 리샘플링해서 빠릅니다.
+    if max(img.size) > max_edge:
+        img.thumbnail((max_edge, max_edge), PIL.Image.LANCZOS, reducing_gap=2.0)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    t3 = time.perf_counter()
+
+    # exif 등 메타데이터는 넘기지 않으므로 자연스럽게 제거됩니다.
+    out = io.BytesIO()
+    img.save(out, format=fmt, quality=quality, optimize=True)
+    data = out.getvalue()
+    t4 = time.perf_counter()
+
+    metrics.observe("span_seconds", t2 - t0, span="image_decode")
+    logger.info(
+        "이미지 전처리 %s→%s, %d→%d bytes | open=%.1fms orient=%.1fms resize=%.1fms encode=%.1fms",
+        original_size, img.size, len(raw_bytes), len(data),
+        (t1 - t0) * 1000, (t2 - t1) * 1000, (t3 - t2) * 1000, (t4 - t3) * 1000,
+    )
+    return {"mime_type": _MIME_TYPES[fmt], "data": data}
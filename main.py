@@ -1,31 +1,142 @@
 # main.py (최종 DB 연동 버전)
-from fastapi import FastAPI, UploadFile, File
+import time
+_boot = time.perf_counter()
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List
-import google.generativeai as genai
-import PIL.Image
-import io
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import firestore
+from contextlib import asynccontextmanager
 from datetime import datetime
+import asyncio
+import json
+import logging
+import os
+from cache import get_cache, make_key
+from image_utils import preprocess_image
+from food_index import get_food_index
+from model_gateway import get_gateway, ModelTimeoutError, ModelBusyError, ModelUnavailableError
+from nutrition import aparse_nutrition, MealResult, MEAL_CONFIG, MAX_MEAL_PHOTOS, build_log_data, chunk_images, merge_meal_results, meal_chunk_start, meal_chunk_done
+from write_queue import get_writer
+import metrics
+import profiling
+import clients
+metrics.setup_logging()
+clients.startup.record("main.py import", time.perf_counter() - _boot)
 
-# 1. 구글 클라우드(Firestore) 열쇠 연결
-# (secrets.json 파일이 같은 폴더에 있어야 합니다)
-cred = credentials.Certificate("secrets.json")
+# 1. 저장소 연결: 구글 클라우드(Firestore) 열쇠 또는 로컬 SQLite (STORAGE_BACKEND)
+# (secrets.json 파일 또는 FIREBASE_KEY 환경 변수 / 처음 쓸 때 연결합니다)
+def get_repo():
+    return clients.get_repo()
 
-# 이미 연결되어 있지 않다면 연결하기
-if not firebase_admin._apps:
-    firebase_admin.initialize_app(cred)
+# 2. AI(Gemini) 설정
+# [중요] GOOGLE_API_KEY 환경 변수 또는 여기에 본인의 API 키를 넣어주세요!
+# (MODEL_BACKEND=stub 이면 로컬 가짜 모델, replay 이면 녹화된 응답을 씁니다)
+def get_model():
+    return clients.get_model('models/gemini-2.5-flash', api_key=os.environ.get("GOOGLE_API_KEY", "API_키_여기에_붙여넣기"))
 
-db = firestore.client() # 공책(DB) 열기
+# 3. 워밍업: 서버가 요청을 받기 전에 DB/모델을 미리 만들어 첫 요청이 느려지지 않게 합니다.
+@asynccontextmanager
+async def lifespan(app):
+    if os.environ.get("WARMUP", "1") == "1":
+        await asyncio.to_thread(get_repo)
+        await asyncio.to_thread(get_model)
+        get_gateway()
+        get_cache()
+        # 지난번에 보내지 못하고 남은 기록이 있으면 바로 이어서 보냅니다.
+        get_writer()
+    clients.startup.report()
+    yield
 
-# 2. AI(Gemini) 설정
-# [중요] 여기에 본인의 API 키를 넣어주세요!
-genai.configure(api_key="API_키_여기에_붙여넣기")
-model = genai.GenerativeModel('models/gemini-2.5-flash')
+app = FastAPI(title="든든 타이거", lifespan=lifespan)
+
+# --- 요청 본문 크기 제한 (MAX_UPLOAD_MB, 0이면 끔) ---
+# 업로드 파일은 Starlette가 본문을 끝까지 받아 풀어 둔 뒤에야 라우트에 들어오므로, 라우트 안의 장수 확인
+# (MAX_MEAL_PHOTOS)만으로는 큰 요청을 막지 못합니다. 본문을 받는 단계에서 바이트 수를 세어 넘으면 413.
+MAX_UPLOAD_BYTES = int(float(os.environ.get("MAX_UPLOAD_MB", "40")) * 1024 * 1024)
+
+class BodyTooLarge(Exception):
+    pass
+
+class BodySizeLimit:
+    def __init__(self, app, max_bytes):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.max_bytes:
+            return await self.app(scope, receive, send)
+        # Content-Length가 있으면 본문을 받기 전에 바로 거절합니다.
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > self.max_bytes:
+            return await self.reject(send)
+
+        # 없거나(chunked) 거짓이면 받는 만큼 세다가 넘는 순간 멈춥니다.
+        # (본문 파싱 쪽에서 예외를 400으로 바꿔 응답해도, 넘었으면 그 응답 대신 413을 보냅니다)
+        received, too_large, started = 0, False, False
+
+        async def limited_receive():
+            nonlocal received, too_large
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    too_large = True
+                    raise BodyTooLarge()
+            return message
+
+        async def limited_send(message):
+            nonlocal started
+            if too_large:
+                if message["type"] == "http.response.start" and not started:
+                    started = True
+                    await self.reject(send)
+                return
+            started = started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, limited_send)
+        except BodyTooLarge:
+            if not started:
+                await self.reject(send)
+
+    async def reject(self, send):
+        metrics.inc("http_body_too_large")
+        limit_mb = self.max_bytes / 1024 / 1024
+        response = PlainTextResponse(f"요청이 너무 큽니다. (최대 {limit_mb:g}MB)", status_code=413)
+        await response({"type": "http"}, None, send)
+
+app.add_middleware(BodySizeLimit, max_bytes=MAX_UPLOAD_BYTES)
 
-app = FastAPI(title="든든 타이거")
+# --- 요청마다: 걸린 시간(경로별 히스토그램) / 상태 코드별 횟수 / 구조화 로그 ---
+# 경로는 실제 URL이 아니라 라우트 패턴으로 셉니다. (라벨 종류가 끝없이 늘어나지 않게)
+# X-Profile 헤더가 있고 PROFILING_ENABLED=1이면 그 요청을 프로파일링해서 X-Profile-Path로 알려 줍니다.
+# (스트리밍 응답은 본문을 보내기 전까지만 잽니다)
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    start = time.perf_counter()
+    kind = profiling.requested_kind(request.headers.get("x-profile"))
+    profiler = profiling.start(kind) if kind else None
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    except Exception:
+        metrics.log("request_error", level=logging.ERROR, exc_info=True, method=request.method, path=request.url.path)
+        raise
+    finally:
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        elapsed = time.perf_counter() - start
+        metrics.observe("http_request_seconds", elapsed, route=route, method=request.method)
+        metrics.inc("http_requests", route=route, method=request.method, status=status)
+        if status >= 500:
+            metrics.inc("http_errors", route=route, status=status)
+        profile_path = profiling.stop(profiler, route) if profiler else None
+        if route != "/metrics":
+            metrics.log("request", method=request.method, route=route, status=status, ms=round(elapsed * 1000, 1))
+    if profile_path:
+        response.headers["X-Profile-Path"] = profile_path
+    return response
 
 class UserProfile(BaseModel):
     nickname: str
@@ -33,35 +144,174 @@ class UserProfile(BaseModel):
     weight: float
     goals: List[str]
 
-# --- [인사 및 저장 기능] ---
-@app.post("/api/v1/greeting")
-async def get_welcome_message(profile: UserProfile):
-    # AI 인사말 생성
-    prompt = f"시니어 앱 '든든 타이거'로서 {profile.nickname} 어르신(목표: {', '.join(profile.goals)})에게 씩씩한 환영 인사를 3문장 이내로 해줘."
-    response = model.generate_content(prompt)
-    ai_msg = response.text
-    
+# --- 모델 호출: 이벤트 루프를 막지 않도록 게이트웨이(비동기 + 동시 호출 제한)를 거칩니다 ---
+# user를 주면 사용자별 한도를 적용합니다. 한도 초과 / 대기열 가득이면 429 + Retry-After로 바로 돌려보냅니다.
+# (재시도해도 모델 쪽 오류가 계속되면 503 + Retry-After)
+def busy_error(e):
+    status_code = 503 if isinstance(e, ModelUnavailableError) else 429
+    return HTTPException(status_code=status_code, detail=str(e), headers={"Retry-After": e.retry_after_header})
+
+async def generate(contents, user=None, **kwargs):
+    try:
+        return await get_gateway().generate(get_model(), contents, user=user, **kwargs)
+    except ModelTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except ModelBusyError as e:
+        raise busy_error(e)
+
+def greeting_prompt(profile):
+    return f"시니어 앱 '든든 타이거'로서 {profile.nickname} 어르신(목표: {', '.join(profile.goals)})에게 씩씩한 환영 인사를 3문장 이내로 해줘."
+
+def food_message(food):
+    return (
+        f"🍱 {food['food_name']}: {food['calories']}kcal, 탄수화물 {food['carbs']}g, 단백질 {food['protein']}g, "
+        f"지방 {food['fat']}g, 나트륨 {food['sodium']}mg, 당류 {food['sugar']}g ({food['analysis']}) "
+        f"💊 {food['vitamin_info']} 💡 {food['tips']}"
+    )
+
+def save_profile(profile, ai_msg):
     # [핵심] Firestore에 저장하기 💾
-    doc_ref = db.collection(u'users').document(profile.nickname)
-    doc_ref.set({
+    # 로컬 대기열(spool)에 적고 바로 돌아갑니다. 백그라운드에서 모아서 batch로 보냅니다.
+    get_writer().enqueue_profile(profile.nickname, {
         u'nickname': profile.nickname,
         u'height': profile.height,
         u'weight': profile.weight,
         u'goals': profile.goals,
         u'last_login': datetime.now(),
         u'last_message': ai_msg
-    }, merge=True) # merge=True는 기존 정보가 있으면 덮어쓰기
+    }) # merge=True로 보내므로 기존 정보가 있으면 덮어쓰기
+
+    metrics.log("profile_enqueued", nickname=profile.nickname)
+
+async def repair_json(prompt):
+    response = await generate(prompt, generation_config={"response_mime_type": "application/json"})
+    return response.text
 
-    print(f"✅ {profile.nickname} 님의 정보가 DB에 저장되었습니다!")
+# --- [인사 및 저장 기능] ---
+@app.post("/api/v1/greeting")
+async def get_welcome_message(profile: UserProfile):
+    # AI 인사말 생성
+    response = await generate(greeting_prompt(profile), user=profile.nickname)
+    ai_msg = response.text
+    save_profile(profile, ai_msg)
     return {"message": ai_msg}
 
+# --- [인사 기능: 스트리밍 버전 (Server-Sent Events)] ---
+# data: {"text": "조각"} 이벤트를 차례로 보내고, 마지막에 event: done 으로 전체 문장을 보냅니다.
+def sse(data, event=None):
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/api/v1/greeting/stream")
+async def stream_welcome_message(profile: UserProfile):
+    chunks = get_gateway().stream(get_model(), greeting_prompt(profile), metric="greeting", user=profile.nickname)
+    # 첫 조각은 미리 받아 둡니다: 제한 시간 초과(504)나 한도 초과(429)를 스트림 시작 전에 알려줄 수 있습니다.
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = ""
+    except ModelTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except ModelBusyError as e:
+        raise busy_error(e)
+
+    async def events():
+        parts = [first]
+        yield sse({"text": first})
+        async for text in chunks:
+            parts.append(text)
+            yield sse({"text": text})
+        ai_msg = "".join(parts)
+        save_profile(profile, ai_msg)
+        yield sse({"message": ai_msg}, event="done")
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 # --- [식단 분석 기능] ---
 @app.post("/api/v1/analyze_food")
-async def analyze_food(file: UploadFile = File(...)):
+async def analyze_food(file: UploadFile = File(...), nickname: str = Form(""), food_name: str = Form("")):
     contents = await file.read()
-    image = PIL.Image.open(io.BytesIO(contents))
-    
     prompt = "이 음식 사진을 보고 메뉴 이름, 영양소 평가, 시니어를 위한 조언을 씩씩하게 해줘."
-    response = model.generate_content([prompt, image])
-    
-    return {"message": response.text}
\ No newline at end of file
+
+    # [전처리] 방향 보정 + 축소 + 재압축 (메타데이터 제거)
+    try:
+        image = await asyncio.to_thread(preprocess_image, contents)
+    except Exception:
+        raise HTTPException(status_code=400, detail="이미지 파일을 읽을 수 없습니다.")
+
+    # [로컬] 음식 이름이 표에 있거나, 같은 사용자가 전에 보낸 사진과 거의 같으면 모델을 부르지 않습니다.
+    food_index = get_food_index()
+    local, source, photo_hash = await asyncio.to_thread(food_index.find, nickname, food_name, image["data"])
+    if source == "table":
+        return {"message": food_message(local), "source": source}
+    if source == "photo":
+        return {"message": local["message"], "source": source}
+
+    # [캐시] 같은 사진 + 같은 프롬프트 + 같은 모델이면 저장된 답변을 돌려줍니다.
+    cache = get_cache()
+    cache_key = make_key(image["data"], prompt, get_model().model_name)
+    message = cache.get(cache_key)
+    source = "cache"
+    if message is None:
+        response = await generate([prompt, image], user=nickname or None)
+        message = response.text
+        cache.set(cache_key, message)
+        source = "model"
+    food_index.remember(nickname, photo_hash, {"message": message})
+
+    return {"message": message, "source": source}
+
+# --- [한 끼(사진 여러 장) 분석 기능] ---
+# 사진을 한 번의 요청으로 보내고(MEAL_CHUNK_SIZE장 초과 시 나눠서 동시에), 음식별 + 합계를 돌려줍니다.
+# nickname을 보내면 음식별 기록을 한 묶음으로 저장 대기열에 넣습니다 (diet_logs에 batch 한 번으로 전송).
+@app.post("/api/v1/analyze_meal")
+async def analyze_meal(files: List[UploadFile] = File(...), nickname: str = Form(""), meal_type: str = Form("")):
+    # 사진을 줄이기(전처리) 전에 장수부터 봅니다. (한 요청이 작업 스레드를 다 차지하지 않게)
+    # 이 시점엔 Starlette가 이미 본문을 다 받았으므로, 전체 바이트 수는 BodySizeLimit가 받는 단계에서 막습니다.
+    if len(files) > MAX_MEAL_PHOTOS:
+        raise HTTPException(status_code=413, detail=f"사진은 한 번에 {MAX_MEAL_PHOTOS}장까지 보낼 수 있습니다.")
+    contents = [await f.read() for f in files]
+    try:
+        images = await asyncio.gather(*(asyncio.to_thread(preprocess_image, c) for c in contents))
+    except Exception:
+        raise HTTPException(status_code=400, detail="이미지 파일을 읽을 수 없습니다.")
+
+    cache = get_cache()
+
+    async def analyze_chunk(chunk):
+        prompt, cache_key, cached = meal_chunk_start(chunk, cache, get_model().model_name)
+        if cached is not None:
+            return cached
+        # JSON 형식을 강제하고, 그래도 깨지면 사진 없이 글만으로 복구를 시도합니다.
+        response = await generate([prompt, *chunk], user=nickname or None, generation_config=MEAL_CONFIG)
+        data = await aparse_nutrition(response.text, MealResult, repair_fn=repair_json)
+        return meal_chunk_done(data, chunk, cache, cache_key)
+
+    results = await asyncio.gather(*(analyze_chunk(chunk) for chunk in chunk_images(images)))
+    if not all(results):
+        raise HTTPException(status_code=502, detail="AI 응답을 해석하지 못했습니다.")
+    meal = merge_meal_results(results)
+
+    saved = False
+    if nickname.strip() and meal["items"]:
+        now = datetime.now()
+        logs = [build_log_data(item, now.date(), now, meal_type, now) for item in meal["items"]]
+        get_writer().enqueue_diet_logs(nickname, logs)
+        saved = True
+
+    return {**meal, "saved": saved}
+
+# --- [캐시 통계] ---
+@app.get("/api/v1/cache_stats")
+async def cache_stats():
+    return {**get_cache().stats(), "food_index": get_food_index().stats()}
+
+# --- [지표: 첫 글자까지 걸린 시간(TTFT), 전체 시간 등] ---
+@app.get("/api/v1/metrics")
+async def get_metrics():
+    return metrics.snapshot()
+
+# --- [Prometheus 수집용: 지연 시간 히스토그램, 오류 횟수, 캐시 적중률] ---
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.prometheus_text(), media_type="text/plain; version=0.0.4; charset=utf-8")
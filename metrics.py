@@ -0,0 +1,216 @@
+# metrics.py (지표 / 구간 시간 / 구조화 로그: app.py / main.py가 함께 사용)
+# - inc(): 횟수 (예: 파싱 성공/실패)
+# - observe(): 시간·크기 같은 측정값 (횟수, 합계, 최댓값 + 히스토그램 구간별 개수)
+# - set_gauge(): 지금 값 (예: 저장 대기열 길이)
+# - span() / timed(): 구간 시간 재기 → span_seconds{span="..."}, 예외가 나면 span_errors{span="..."}
+# - prometheus_text(): /metrics 에서 내보내는 Prometheus 텍스트 형식
+# - log(): 구조화 로그 (LOG_FORMAT=json 이면 한 줄에 JSON 하나, 아니면 "이벤트 키=값 ...")
+# 라벨은 키워드 인자로 붙입니다: inc("http_requests", route="/api/v1/greeting", status=200)
+import functools
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+PREFIX = "dundun_"
+# 히스토그램 구간 (초): 이미지 전처리(수 ms) ~ 모델 호출(수십 초)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# 적중률 = 적중 / (적중 + 실패). 카운터에서 바로 계산해 게이지처럼 내보냅니다.
+HIT_RATIOS = {
+    "analysis_cache_hit_ratio": (["analysis_cache_hits"], ["analysis_cache_misses"]),
+    "query_cache_hit_ratio": (["query_cache_hits"], ["query_cache_misses"]),
+    "food_index_local_hit_ratio": (["food_index_table", "food_index_photo"], ["food_index_miss"]),
+}
+
+_lock = threading.Lock()
+_counters = {}  # (이름, 라벨) → 값
+_observations = {}
+_gauges = {}
+
+logger = logging.getLogger("dundun")
+
+
+def _key(name, labels):
+    return (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    key = _key(name, labels)
+    with _lock:
+        entry = _observations.setdefault(
+            key, {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * len(LATENCY_BUCKETS)},
+        )
+        entry["count"] += 1
+        entry["sum"] += value
+        entry["max"] = max(entry["max"], value)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                entry["buckets"][i] += 1
+                break
+
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+# --- 구간 시간 재기 ---
+@contextmanager
+def span(name, **fields):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        inc("span_errors", span=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        observe("span_seconds", elapsed, span=name)
+        if logger.isEnabledFor(logging.DEBUG):
+            log("span", level=logging.DEBUG, span=name, ms=round(elapsed * 1000, 2), **fields)
+
+
+def timed(name):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# --- 읽기 ---
+def _label_text(labels, extra=()):
+    items = [*labels, *extra]
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _ratios(counters):
+    totals = {}
+    for (name, labels), value in counters.items():
+        if not labels:
+            totals[name] = totals.get(name, 0) + value
+    ratios = {}
+    for ratio, (hit_names, miss_names) in HIT_RATIOS.items():
+        hits = sum(totals.get(n, 0) for n in hit_names)
+        misses = sum(totals.get(n, 0) for n in miss_names)
+        if hits + misses:
+            ratios[ratio] = round(hits / (hits + misses), 4)
+    return ratios
+
+
+def snapshot():
+    with _lock:
+        counters = dict(_counters)
+        observations = {
+            name + _label_text(labels): {
+                "count": entry["count"], "sum": entry["sum"], "max": entry["max"],
+                "avg": entry["sum"] / entry["count"] if entry["count"] else 0.0,
+            }
+            for (name, labels), entry in _observations.items()
+        }
+        gauges = {name + _label_text(labels): value for (name, labels), value in _gauges.items()}
+    return {
+        "counters": {name + _label_text(labels): value for (name, labels), value in counters.items()},
+        "gauges": {**gauges, **_ratios(counters)},
+        "observations": observations,
+    }
+
+
+def _metric_name(name):
+    return PREFIX + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def prometheus_text():
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        observations = {key: {**entry, "buckets": list(entry["buckets"])} for key, entry in _observations.items()}
+
+    lines, typed = [], set()
+
+    def declare(metric, kind):
+        if metric not in typed:
+            typed.add(metric)
+            lines.append(f"# TYPE {metric} {kind}")
+
+    for (name, labels), value in sorted(counters.items()):
+        metric = _metric_name(name) + "_total"
+        declare(metric, "counter")
+        lines.append(f"{metric}{_label_text(labels)} {value}")
+    for (name, labels), value in sorted(gauges.items()):
+        metric = _metric_name(name)
+        declare(metric, "gauge")
+        lines.append(f"{metric}{_label_text(labels)} {value}")
+    for name, value in sorted(_ratios(counters).items()):
+        metric = _metric_name(name)
+        declare(metric, "gauge")
+        lines.append(f"{metric} {value}")
+    for (name, labels), entry in sorted(observations.items()):
+        metric = _metric_name(name)
+        declare(metric, "histogram")
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, entry["buckets"]):
+            cumulative += count
+            lines.append(f"{metric}_bucket{_label_text(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{metric}_bucket{_label_text(labels, [('le', '+Inf')])} {entry['count']}")
+        lines.append(f"{metric}_sum{_label_text(labels)} {entry['sum']}")
+        lines.append(f"{metric}_count{_label_text(labels)} {entry['count']}")
+    return "\n".join(lines) + "\n"
+
+
+# --- 구조화 로그 ---
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        fields = " ".join(f"{k}={v}" for k, v in getattr(record, "fields", {}).items())
+        text = f"{self.formatTime(record)} {record.levelname} {record.getMessage()} {fields}".rstrip()
+        if record.exc_info:
+            text += "\n" + self.formatException(record.exc_info)
+        return text
+
+
+# "dundun" 아래 로거(dundun.*)만 설정합니다. Streamlit / uvicorn 로그 설정은 건드리지 않습니다.
+def setup_logging():
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if os.environ.get("LOG_FORMAT", "text").lower() == "json" else TextFormatter())
+    logger.addHandler(handler)
+    logger.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+    logger.propagate = False
+
+
+def log(event, level=logging.INFO, exc_info=False, **fields):
+    logger.log(level, event, exc_info=exc_info, extra={"fields": fields})
@@ -0,0 +1,270 @@
+# model_backend.py (모델 백엔드 교체 기능)
+# - gemini : 실제 Gemini (google.generativeai)
+# - stub   : 정해진 영양 JSON/문장을 설정한 지연 시간 뒤에 돌려주는 로컬 가짜 모델 (부하 테스트용)
+#            MODEL_STUB_ERROR_RATE로 일시적 오류(TransientModelError)를 섞을 수 있습니다.
+# - replay : 녹화해 둔 응답(JSONL)을 그대로 재생 (MODEL_REPLAY_RECORD=1이면 Gemini 응답을 녹화,
+#            MODEL_REPLAY_SOURCE=stub이면 stub 응답을 녹화)
+# 모든 백엔드는 genai.GenerativeModel과 같은 모양(generate_content / generate_content_async / model_name,
+# stream=True 지원)이라 기존 호출 코드를 바꾸지 않고 끼워 넣을 수 있습니다.
+import asyncio
+import hashlib
+import io
+import json
+import os
+import random
+import threading
+import time
+
+import metrics
+
+
+# 잠깐 뒤에 다시 하면 될 수 있는 오류 (과부하, 일시적 서버 오류 등). 게이트웨이가 재시도합니다.
+class TransientModelError(Exception):
+    pass
+
+
+class ModelResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+# --- 내용(프롬프트 + 이미지)을 해시로 요약: 재생 백엔드의 키, 가짜 모델의 선택 기준 ---
+def contents_digest(contents):
+    if not isinstance(contents, (list, tuple)):
+        contents = [contents]
+    h = hashlib.sha256()
+    for part in contents:
+        if isinstance(part, str):
+            data = part.encode("utf-8")
+        elif isinstance(part, dict):
+            data = part.get("data", b"")
+        elif isinstance(part, bytes):
+            data = part
+        else:
+            # PIL 이미지
+            buf = io.BytesIO()
+            part.save(buf, format="PNG")
+            data = buf.getvalue()
+        h.update(len(data).to_bytes(8, "big"))
+        h.update(data)
+    return h.hexdigest()
+
+
+def count_images(contents):
+    if not isinstance(contents, (list, tuple)):
+        return 0
+    return sum(1 for part in contents if not isinstance(part, str))
+
+
+class ModelBackend:
+    model_name = ""
+    quota_key = "default"  # 같은 사용량 한도(API 키)를 나눠 쓰는 백엔드끼리 같은 값
+
+    def generate_content(self, contents, **kwargs):
+        raise NotImplementedError
+
+    async def generate_content_async(self, contents, **kwargs):
+        return await asyncio.to_thread(self.generate_content, contents, **kwargs)
+
+    # --- 간단한 사용법: 글만 / 사진 + 글 ---
+    def generate_text(self, prompt, **kwargs):
+        return self.generate_content(prompt, **kwargs).text
+
+    def generate_from_image(self, prompt, image, **kwargs):
+        return self.generate_content([prompt, image], **kwargs).text
+
+
+# 스레드로 감싼 기본 구현이 아니라 진짜 비동기 generate_content_async가 있는지
+# (genai.GenerativeModel, StubBackend 등). 없으면 호출하는 쪽이 자기 스레드 풀을 씁니다.
+def has_native_async(model):
+    method = getattr(type(model), "generate_content_async", None)
+    return method is not None and method is not ModelBackend.generate_content_async
+
+
+class GeminiBackend(ModelBackend):
+    def __init__(self, model_name, api_key=None):
+        import google.generativeai as genai
+
+        if api_key:
+            genai.configure(api_key=api_key)
+        self._model = genai.GenerativeModel(model_name)
+        self.model_name = self._model.model_name
+        if api_key:
+            self.quota_key = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+    def generate_content(self, contents, **kwargs):
+        return self._model.generate_content(contents, **kwargs)
+
+    async def generate_content_async(self, contents, **kwargs):
+        return await self._model.generate_content_async(contents, **kwargs)
+
+
+# --- 로컬 가짜 모델에서 돌려줄 정해진 답변 ---
+STUB_FOODS = [
+    {"food_name": "김치찌개와 현미밥", "calories": 520, "carbs": 72, "protein": 24, "fat": 14,
+     "sugar": 6, "sodium": 1850, "cholesterol": 45, "calcium": 120},
+    {"food_name": "된장국과 잡곡밥", "calories": 450, "carbs": 70, "protein": 18, "fat": 9,
+     "sugar": 4, "sodium": 1300, "cholesterol": 10, "calcium": 150},
+    {"food_name": "고등어구이 정식", "calories": 610, "carbs": 68, "protein": 35, "fat": 21,
+     "sugar": 5, "sodium": 1100, "cholesterol": 90, "calcium": 80},
+    {"food_name": "비빔밥", "calories": 560, "carbs": 85, "protein": 20, "fat": 15,
+     "sugar": 9, "sodium": 1200, "cholesterol": 180, "calcium": 110},
+]
+
+
+class StubBackend(ModelBackend):
+    model_name = "stub"
+
+    def __init__(self, latency=0.3, error_rate=0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+
+    def _maybe_fail(self):
+        if self.error_rate and random.random() < self.error_rate:
+            raise TransientModelError("가짜 모델: 일시적 오류")
+
+    def _answer(self, contents):
+        n_images = count_images(contents)
+        if n_images:
+            digest = contents_digest(contents)
+            start = int(digest[:8], 16)
+            foods = [dict(STUB_FOODS[(start + i) % len(STUB_FOODS)]) for i in range(n_images)]
+            comments = {
+                "analysis": "단백질은 적당하지만 나트륨이 조금 많아요.",
+                "tips": "국물은 절반만 드시고 채소 반찬을 곁들이세요.",
+            }
+            # 한 끼(여러 장) 프롬프트는 items 목록으로 답합니다.
+            if any(isinstance(part, str) and '"items"' in part for part in contents):
+                return json.dumps({"items": foods, **comments}, ensure_ascii=False)
+            food = foods[0]
+            food.update({"vitamin_info": "비타민 B군과 칼륨이 들어 있어요.", **comments})
+            return json.dumps(food, ensure_ascii=False)
+        return "반갑습니다! 오늘도 든든하게 챙겨 드시고 건강한 하루 보내세요."
+
+    # 스트리밍은 첫 조각까지 latency, 이후 조각마다 짧게 쉬며 나눠 보냅니다.
+    def _pieces(self, text, size=8):
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        time.sleep(self.latency)
+        self._maybe_fail()
+        text = self._answer(contents)
+        if stream:
+            return self._stream(text)
+        return ModelResponse(text)
+
+    def _stream(self, text):
+        for piece in self._pieces(text):
+            yield ModelResponse(piece)
+            time.sleep(0.01)
+
+    async def generate_content_async(self, contents, stream=False, **kwargs):
+        await asyncio.sleep(self.latency)
+        self._maybe_fail()
+        text = self._answer(contents)
+        if stream:
+            return self._astream(text)
+        return ModelResponse(text)
+
+    async def _astream(self, text):
+        for piece in self._pieces(text):
+            yield ModelResponse(piece)
+            await asyncio.sleep(0.01)
+
+
+class ReplayBackend(ModelBackend):
+    def __init__(self, path, recorder=None):
+        self.path = path
+        self.recorder = recorder  # 녹화 모드일 때 실제로 부를 백엔드
+        self.model_name = f"replay:{recorder.model_name}" if recorder else "replay"
+        self._lock = threading.Lock()
+        self._records = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self._records[record["key"]] = record["text"]
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        key = contents_digest(contents)
+        with self._lock:
+            text = self._records.get(key)
+        if text is None:
+            if self.recorder is None:
+                raise KeyError(f"녹화된 응답이 없습니다: {key[:12]}")
+            text = self.recorder.generate_content(contents, **kwargs).text
+            self._record(key, text)
+        # 녹화본은 통째로 저장되어 있으므로 스트리밍도 한 조각으로 돌려줍니다.
+        return [ModelResponse(text)] if stream else ModelResponse(text)
+
+    def _record(self, key, text):
+        with self._lock:
+            self._records[key] = text
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "text": text}, ensure_ascii=False) + "\n")
+
+
+# --- 스트리밍: 글자 조각을 차례로 돌려주면서 첫 조각까지 걸린 시간(TTFT)과 전체 시간을 기록 ---
+def _chunk_text(chunk):
+    try:
+        return chunk.text
+    except ValueError:
+        # Gemini는 안전 필터 등으로 글이 없는 조각에서 ValueError를 냅니다.
+        return ""
+
+
+def stream_text(model, contents, metric="model", **kwargs):
+    start = time.perf_counter()
+    first = None
+    for chunk in model.generate_content(contents, stream=True, **kwargs):
+        text = _chunk_text(chunk)
+        if not text:
+            continue
+        if first is None:
+            first = time.perf_counter() - start
+            metrics.observe(f"{metric}_ttft_seconds", first)
+        yield text
+    metrics.observe(f"{metric}_total_seconds", time.perf_counter() - start)
+
+
+async def astream_text(model, contents, metric="model", **kwargs):
+    start = time.perf_counter()
+    first = None
+    stream = await model.generate_content_async(contents, stream=True, **kwargs)
+    if hasattr(stream, "__aiter__"):
+        chunks = stream
+    else:
+        async def to_async(items):
+            for item in items:
+                yield item
+        chunks = to_async(stream)
+    async for chunk in chunks:
+        text = _chunk_text(chunk)
+        if not text:
+            continue
+        if first is None:
+            first = time.perf_counter() - start
+            metrics.observe(f"{metric}_ttft_seconds", first)
+        yield text
+    metrics.observe(f"{metric}_total_seconds", time.perf_counter() - start)
+
+
+# --- 환경 변수(MODEL_BACKEND)에 따라 백엔드 만들기 ---
+def get_backend(model_name, api_key=None):
+    kind = os.environ.get("MODEL_BACKEND", "gemini").lower()
+    if kind == "stub":
+        return StubBackend(
+            latency=float(os.environ.get("MODEL_STUB_LATENCY", "0.3")),
+            error_rate=float(os.environ.get("MODEL_STUB_ERROR_RATE", "0")),
+        )
+    if kind == "replay":
+        recorder = None
+        if os.environ.get("MODEL_REPLAY_RECORD") == "1":
+            # MODEL_REPLAY_SOURCE=stub: 가짜 모델 응답을 녹화 (키 없이 벤치마크용 녹화 파일을 만들 때)
+            if os.environ.get("MODEL_REPLAY_SOURCE", "gemini").lower() == "stub":
+                recorder = StubBackend(latency=0)
+            else:
+                recorder = GeminiBackend(model_name, api_key=api_key)
+        return ReplayBackend(os.environ.get("MODEL_REPLAY_FILE", "replay.jsonl"), recorder=recorder)
+    return GeminiBackend(model_name, api_key=api_key)
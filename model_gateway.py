@@ -0,0 +1,242 @@
+# model_gateway.py (FastAPI용 비동기 모델 호출)
+# - async def 안에서 동기 generate_content를 부르면 이벤트 루프 전체가 멈춥니다.
+# - 비동기 API(generate_content_async)가 있으면 그것을, 없으면(ModelBackend 기본 구현의 to_thread 포함) 제한된 스레드 풀을 씁니다.
+# - 동시에 나가는 호출 수(세마포어)와 호출당 제한 시간을 설정할 수 있습니다.
+# - 몰려드는 요청으로부터 Gemini 사용량 한도를 지킵니다.
+#   · 사용자별 / API 키별 토큰 버킷: 사용자 한도를 넘으면 바로 거절, API 키 한도는 잠깐(max_wait)까지 기다림
+#   · 대기열이 가득 차면 기다리게 하지 않고 바로 거절 (ModelBusyError → 429 + Retry-After)
+#   · 똑같은 호출(같은 모델 + 같은 내용 + 같은 설정)이 이미 진행 중이면 새로 부르지 않고 결과를 나눠 받음
+#   · 일시적 오류(과부하, 503 등)는 지터를 섞은 지수 백오프로 다시 시도 (끝내 실패하면 ModelUnavailableError → 503)
+import asyncio
+import functools
+import math
+import os
+import random
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from model_backend import TransientModelError, astream_text, contents_digest, has_native_async
+
+# google.api_core.exceptions 중 다시 시도할 만한 오류 이름 (google 패키지를 직접 import하지 않습니다)
+TRANSIENT_ERROR_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+    "BadGateway", "GatewayTimeout", "DeadlineExceeded", "Aborted",
+}
+
+
+class ModelTimeoutError(Exception):
+    pass
+
+
+class ModelBusyError(Exception):
+    def __init__(self, message, retry_after=1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    # Retry-After 헤더 값 (정수 초, 최소 1초)
+    @property
+    def retry_after_header(self):
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+# 재시도해도 모델 쪽 일시적 오류가 계속될 때 (→ 503 + Retry-After)
+class ModelUnavailableError(ModelBusyError):
+    pass
+
+
+def is_transient(error):
+    return isinstance(error, (TransientModelError, ConnectionError)) or type(error).__name__ in TRANSIENT_ERROR_NAMES
+
+
+# --- 토큰 버킷: 초당 rate개씩 채워지고 최대 burst개까지 모입니다 ---
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    # 다음 토큰까지 기다려야 하는 초를 돌려줍니다 (0이면 바로 사용 가능).
+    # 기다릴 시간이 max_wait 이하면 토큰을 미리 예약합니다. (토큰이 음수가 되어 뒤에 오는 요청이 더 기다림)
+    def take(self, max_wait=0.0):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        if wait <= max_wait:
+            self.tokens -= 1
+        return wait
+
+
+class ModelGateway:
+    def __init__(
+        self, max_concurrency=8, timeout=30.0, max_queue=None,
+        key_rate=0.0, key_burst=10, user_rate=0.0, user_burst=5, max_wait=2.0,
+        max_retries=2, retry_backoff=0.5, max_users=10000,
+    ):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_queue = max_queue  # None이면 제한 없음
+        self.key_rate = key_rate  # 0이면 제한 없음
+        self.key_burst = key_burst
+        self.user_rate = user_rate  # 0이면 제한 없음
+        self.user_burst = user_burst
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_users = max_users
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="model")
+        self._key_buckets = {}
+        self._user_buckets = OrderedDict()
+        self._flights = {}
+        self._pending = 0  # 실행 중 + 기다리는 호출 수
+        self._latency = 1.0  # 호출 시간 이동 평균 (Retry-After 추정용)
+
+    async def generate(self, model, contents, user=None, **kwargs):
+        # 같은 호출이 이미 진행 중이면 그 결과를 함께 기다립니다. (한도도 쓰지 않음)
+        key = (getattr(model, "model_name", ""), contents_digest(contents), repr(sorted(kwargs.items())))
+        flight = self._flights.get(key)
+        if flight is not None:
+            metrics.inc("gateway_coalesced")
+            return await asyncio.shield(flight)
+
+        wait = self._admit(model, user)
+        # 받은 즉시 센다: 같은 순간에 들어온 요청들이 대기열 한도를 함께 넘지 않도록
+        self._pending += 1
+        metrics.set_gauge("gateway_pending", self._pending)
+        flight = asyncio.ensure_future(self._run(wait, model, contents, **kwargs))
+        self._flights[key] = flight
+        flight.add_done_callback(functools.partial(self._land, key))
+        # shield: 먼저 온 요청이 끊겨도 함께 기다리는 요청들을 위해 호출은 계속됩니다.
+        return await asyncio.shield(flight)
+
+    def _land(self, key, flight):
+        self._flights.pop(key, None)
+        # 기다리던 요청이 모두 끊긴 뒤 실패해도 "처리되지 않은 예외" 경고가 남지 않게 꺼내 둡니다.
+        if not flight.cancelled():
+            flight.exception()
+
+    # --- 스트리밍: 조각을 모두 보낼 때까지 동시 호출 자리 하나를 차지합니다 ---
+    # 제한 시간은 첫 조각까지 적용합니다 (이후에는 조각이 계속 오고 있으므로).
+    # 조각이 나오기 시작하면 되돌릴 수 없으므로 합치기 / 재시도는 하지 않고 한도만 적용합니다.
+    async def stream(self, model, contents, metric="model", user=None, **kwargs):
+        wait = self._admit(model, user)
+        self._pending += 1
+        metrics.set_gauge("gateway_pending", self._pending)
+        try:
+            if wait:
+                await asyncio.sleep(wait)
+            async with self._semaphore:
+                metrics.inc("gateway_calls")
+                chunks = astream_text(model, contents, metric=metric, **kwargs)
+                try:
+                    first = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    raise ModelTimeoutError(f"모델 응답이 {self.timeout}초 안에 오지 않았습니다.")
+                yield first
+                async for text in chunks:
+                    yield text
+        finally:
+            self._pending -= 1
+            metrics.set_gauge("gateway_pending", self._pending)
+
+    # --- 받아도 되는지 바로 판단합니다 (못 받으면 ModelBusyError). API 키 한도 때문에 기다릴 초를 돌려줍니다 ---
+    def _admit(self, model, user):
+        if user and self.user_rate:
+            bucket = self._user_buckets.get(user)
+            if bucket is None:
+                bucket = self._user_buckets[user] = TokenBucket(self.user_rate, self.user_burst)
+                while len(self._user_buckets) > self.max_users:
+                    self._user_buckets.popitem(last=False)
+            self._user_buckets.move_to_end(user)
+            wait = bucket.take()
+            if wait:
+                metrics.inc("gateway_rejected_user")
+                raise ModelBusyError("요청이 너무 잦습니다. 잠시 후 다시 시도해 주세요.", retry_after=wait)
+
+        if self.max_queue is not None and self._pending >= self.max_concurrency + self.max_queue:
+            metrics.inc("gateway_rejected_queue")
+            # 앞에 선 호출들이 빠지는 데 걸릴 시간을 대략 계산합니다.
+            retry_after = (self._pending - self.max_concurrency + 1) * self._latency / self.max_concurrency
+            raise ModelBusyError("요청이 몰려 있습니다. 잠시 후 다시 시도해 주세요.", retry_after=retry_after)
+
+        if not self.key_rate:
+            return 0.0
+        quota_key = getattr(model, "quota_key", "default")
+        bucket = self._key_buckets.get(quota_key)
+        if bucket is None:
+            bucket = self._key_buckets[quota_key] = TokenBucket(self.key_rate, self.key_burst)
+        wait = bucket.take(self.max_wait)
+        if wait > self.max_wait:
+            metrics.inc("gateway_rejected_rate")
+            raise ModelBusyError("모델 사용량 한도에 도달했습니다. 잠시 후 다시 시도해 주세요.", retry_after=wait)
+        return wait
+
+    async def _run(self, wait, model, contents, **kwargs):
+        try:
+            if wait:
+                await asyncio.sleep(wait)
+            async with self._semaphore:
+                return await self._call_with_retries(model, contents, **kwargs)
+        finally:
+            self._pending -= 1
+            metrics.set_gauge("gateway_pending", self._pending)
+
+    # 백오프 동안에도 자리를 내놓지 않습니다: 모델 쪽이 힘들 때 호출을 더 몰아넣지 않기 위해서입니다.
+    async def _call_with_retries(self, model, contents, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            metrics.inc("gateway_calls")
+            try:
+                with metrics.span("model_call"):
+                    result = await asyncio.wait_for(self._call(model, contents, **kwargs), self.timeout)
+            except asyncio.TimeoutError:
+                raise ModelTimeoutError(f"모델 응답이 {self.timeout}초 안에 오지 않았습니다.")
+            except Exception as e:
+                if not is_transient(e):
+                    raise
+                delay = self.retry_backoff * 2 ** attempt * random.uniform(0.5, 1.0)
+                if attempt >= self.max_retries:
+                    metrics.inc("gateway_unavailable")
+                    raise ModelUnavailableError(
+                        "모델이 일시적으로 응답하지 않습니다. 잠시 후 다시 시도해 주세요.", retry_after=delay * 2,
+                    ) from e
+                metrics.inc("gateway_retries")
+                await asyncio.sleep(delay)
+                continue
+            self._latency = 0.8 * self._latency + 0.2 * (time.perf_counter() - start)
+            return result
+
+    async def _call(self, model, contents, **kwargs):
+        if has_native_async(model):
+            return await model.generate_content_async(contents, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(model.generate_content, contents, **kwargs)
+        )
+
+
+# --- 공용 게이트웨이 ---
+_gateway = None
+
+
+def get_gateway():
+    global _gateway
+    if _gateway is None:
+        _gateway = ModelGateway(
+            max_concurrency=int(os.environ.get("MODEL_MAX_CONCURRENCY", "8")),
+            timeout=float(os.environ.get("MODEL_TIMEOUT", "30")),
+            max_queue=int(os.environ.get("MODEL_MAX_QUEUE", "32")),
+            key_rate=float(os.environ.get("MODEL_RATE_PER_KEY", "10")),
+            key_burst=int(os.environ.get("MODEL_BURST_PER_KEY", "20")),
+            user_rate=float(os.environ.get("MODEL_RATE_PER_USER", "0.5")),
+            user_burst=int(os.environ.get("MODEL_BURST_PER_USER", "5")),
+            max_wait=float(os.environ.get("MODEL_RATE_MAX_WAIT", "2")),
+            max_retries=int(os.environ.get("MODEL_MAX_RETRIES", "2")),
+        )
+    return _gateway
@@ -0,0 +1,328 @@
+# nutrition.py (영양 분석 공용 도구: app.py / main.py가 함께 사용)
+import hashlib
+import json
+import os
+import re
+from typing import List, Union
+
+from pydantic import BaseModel, ValidationError, field_validator
+
+import metrics
+from cache import make_key
+
+NUTRIENT_KEYS = ["calories", "carbs", "protein", "fat", "sugar", "sodium", "cholesterol", "calcium"]
+
+# 한 번의 모델 호출에 함께 보낼 사진 수 (넘으면 나눠서 동시에 보냅니다)
+MEAL_CHUNK_SIZE = int(os.environ.get("MEAL_CHUNK_SIZE", "5"))
+# 한 끼에 받는 사진 수 상한 (넘으면 분석하지 않고 돌려보냅니다)
+MAX_MEAL_PHOTOS = int(os.environ.get("MAX_MEAL_PHOTOS", "20"))
+
+_NUMBER = re.compile(r"-?\d[\d,]*(?:\.\d+)?|-?\.\d+")
+
+
+# --- 숫자 변환: "120kcal", "1,200 mg", "약 30g" 같은 문자열도 숫자로 ---
+def to_number(value):
+    if isinstance(value, bool) or value is None:
+        return 0
+    if isinstance(value, (int, float)):
+        return value
+    match = _NUMBER.search(str(value))
+    if not match:
+        return 0
+    number = float(match.group().replace(",", ""))
+    return int(number) if number.is_integer() else number
+
+
+# --- 하루 권장 섭취량 (Mifflin-St Jeor 기초대사량 × 활동 계수) ---
+# batch_report.py가 같은 상수로 여러 사람을 한꺼번에 계산합니다.
+ACTIVITY_FACTOR = 1.2
+MACRO_RATIOS = {"carbs": (0.55, 4), "protein": (0.20, 4), "fat": (0.25, 9)}  # (열량 비율, g당 kcal)
+FIXED_NEEDS = {"sugar": 50, "sodium": 2000, "cholesterol": 300, "calcium": 700}
+DEFAULT_PROFILE = {"age": 65, "gender": "남성", "height": 170, "weight": 60}
+
+
+def calculate_needs(age, gender, height, weight):
+    if gender == "남성":
+        bmr = (10 * weight) + (6.25 * height) - (5 * age) + 5
+    else:
+        bmr = (10 * weight) + (6.25 * height) - (5 * age) - 161
+    tdee = int(bmr * ACTIVITY_FACTOR)
+    return {
+        "calories": tdee,
+        **{key: int((tdee * ratio) / kcal) for key, (ratio, kcal) in MACRO_RATIOS.items()},
+        **FIXED_NEEDS,
+    }
+
+
+# --- 응답 검증용 스키마 ---
+class NutritionItem(BaseModel):
+    # 모델 스키마(_ITEM_SCHEMA["required"])와 같이 이름과 영양소는 모두 있어야 합니다.
+    # ({} 나 {"error": ...} 같은 응답이 0kcal 음식으로 통과해 캐시 / 기록에 남지 않도록)
+    food_name: str
+    calories: Union[int, float]
+    carbs: Union[int, float]
+    protein: Union[int, float]
+    fat: Union[int, float]
+    sugar: Union[int, float]
+    sodium: Union[int, float]
+    cholesterol: Union[int, float]
+    calcium: Union[int, float]
+
+    @field_validator("food_name")
+    @classmethod
+    def _require_name(cls, value):
+        value = value.strip()
+        if not value:
+            raise ValueError("food_name이 비어 있습니다.")
+        return value
+
+    @field_validator(*NUTRIENT_KEYS, mode="before")
+    @classmethod
+    def _coerce_number(cls, value):
+        return to_number(value)
+
+
+class NutritionResult(NutritionItem):
+    vitamin_info: str = ""
+    analysis: str = ""
+    tips: str = ""
+
+
+class MealResult(BaseModel):
+    items: List[NutritionItem]
+    analysis: str = ""
+    tips: str = ""
+
+
+# --- 모델에 JSON 형식을 강제하는 설정 (Gemini response_schema) ---
+_ITEM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "food_name": {"type": "string"},
+        **{key: {"type": "number"} for key in NUTRIENT_KEYS},
+    },
+    "required": ["food_name", *NUTRIENT_KEYS],
+}
+NUTRITION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": {
+        "type": "object",
+        "properties": {
+            **_ITEM_SCHEMA["properties"],
+            "vitamin_info": {"type": "string"},
+            "analysis": {"type": "string"},
+            "tips": {"type": "string"},
+        },
+        "required": _ITEM_SCHEMA["required"],
+    },
+}
+MEAL_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": {
+        "type": "object",
+        "properties": {
+            "items": {"type": "array", "items": _ITEM_SCHEMA},
+            "analysis": {"type": "string"},
+            "tips": {"type": "string"},
+        },
+        "required": ["items"],
+    },
+}
+
+
+# --- JSON 파싱: 앞뒤 설명문이나 코드 블록이 섞여 있어도 첫 번째 완결된 {...}를 꺼냅니다 ---
+# 바깥 { 에서 시작하는 객체만 받습니다. 바깥 객체가 끝나지 않고 잘렸으면(응답 중간 끊김) 안쪽 객체를
+# 대신 돌려주지 않고 None입니다. (잘린 {"items": [{...}] 의 음식 하나가 한 그릇 결과로 둔갑하지 않도록)
+def extract_json_object(text):
+    if not text:
+        return None
+    start = text.find("{")
+    while start != -1:
+        depth, in_string, escaped, end = 0, False, False, None
+        for i in range(start, len(text)):
+            ch = text[i]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch == "{":
+                depth += 1
+            elif ch == "}":
+                depth -= 1
+                if depth == 0:
+                    end = i
+                    break
+        if end is None:
+            return None
+        try:
+            return json.loads(text[start:end + 1])
+        except ValueError:
+            # JSON이 아닌 {...} (설명문 속 중괄호 등)이면 그 다음 바깥 { 부터 다시 찾습니다.
+            start = text.find("{", end + 1)
+    return None
+
+
+@metrics.timed("json_parse")
+def _validate(text, schema):
+    data = extract_json_object(text)
+    if data is None:
+        return None
+    try:
+        return schema.model_validate(data).model_dump()
+    except ValidationError:
+        return None
+
+
+def repair_prompt(text, schema):
+    fields = ", ".join(schema.model_fields)
+    return f"""
+    아래 글을 올바른 JSON 객체 하나로만 바꿔 주세요. 설명이나 코드 블록 없이 JSON만 출력하세요.
+    필드: {fields}
+    숫자 필드에는 단위 없이 숫자만 넣으세요.
+
+    {text}
+    """
+
+
+# --- 영양 JSON 파싱 + 검증 ---
+# 실패해도 응답에 내용이 있으면, 사진을 다시 보내지 않고 글만으로 고치는 값싼 호출(repair_fn)을 한 번 합니다.
+# 성공/실패/복구 횟수는 metrics에 기록합니다 (nutrition_parse_*).
+# 동기(parse_nutrition) / 비동기(aparse_nutrition)는 repair_fn 호출만 다르고, 나머지는 아래 두 단계를 같이 씁니다.
+def _parse_first(text, schema, repair_fn):
+    # (결과, 복구 프롬프트) — 복구가 필요 없거나 할 수 없으면 프롬프트는 None
+    data = _validate(text, schema)
+    if data is None and repair_fn and text and text.strip():
+        metrics.inc("nutrition_parse_repair_calls")
+        return None, repair_prompt(text, schema)
+    return data, None
+
+
+def _parse_done(data, repaired):
+    if repaired and data is not None:
+        metrics.inc("nutrition_parse_repaired")
+    metrics.inc("nutrition_parse_ok" if data is not None else "nutrition_parse_failed")
+    return data
+
+
+def parse_nutrition(text, schema=NutritionResult, repair_fn=None):
+    data, prompt = _parse_first(text, schema, repair_fn)
+    if prompt is not None:
+        try:
+            data = _validate(repair_fn(prompt), schema)
+        except Exception:
+            data = None
+    return _parse_done(data, prompt is not None)
+
+
+async def aparse_nutrition(text, schema=NutritionResult, repair_fn=None):
+    data, prompt = _parse_first(text, schema, repair_fn)
+    if prompt is not None:
+        try:
+            data = _validate(await repair_fn(prompt), schema)
+        except Exception:
+            data = None
+    return _parse_done(data, prompt is not None)
+
+
+# --- 여러 음식 영양소 합계 ---
+def sum_nutrients(items):
+    total = {key: 0 for key in NUTRIENT_KEYS}
+    for item in items:
+        for key in NUTRIENT_KEYS:
+            total[key] += to_number(item.get(key, 0))
+    return {key: round(value, 1) for key, value in total.items()}
+
+
+# --- 한 끼(사진 여러 장) 분석 프롬프트 ---
+def meal_prompt(n_photos):
+    return f"""
+    당신은 시니어 전문 임상영양사 '든든 타이거'입니다.
+    사진 {n_photos}장은 한 끼 식사에 함께 나온 음식들입니다.
+    사진 순서대로 각 음식을 정밀 분석하여 아래 JSON 포맷으로 응답하세요.
+
+    {{
+        "items": [
+            {{
+                "food_name": "음식 이름",
+                "calories": 000,
+                "carbs": 00, "protein": 00, "fat": 00,
+                "sugar": 00, "sodium": 000, "cholesterol": 000, "calcium": 000
+            }}
+        ],
+        "analysis": "한 끼 전체 영양 평가",
+        "tips": "건강 섭취 조언"
+    }}
+    """
+
+
+def chunk_images(images, size=None):
+    size = size or MEAL_CHUNK_SIZE
+    return [images[i:i + size] for i in range(0, len(images), size)]
+
+
+# 여러 사진을 한 번에 보낼 때의 캐시 키용 바이트 (사진 순서까지 반영)
+def images_fingerprint(images):
+    return b"".join(hashlib.sha256(img["data"]).digest() for img in images)
+
+
+# 음식 수가 사진 수와 다르면(빠뜨리거나 두 번 센 음식) 사진 순서대로 맞출 수 없으니 실패(None)로 봅니다.
+def check_meal_items(data, n_photos):
+    if data is not None and len(data["items"]) != n_photos:
+        metrics.inc("meal_item_count_mismatch")
+        return None
+    return data
+
+
+# --- 한 끼 사진 묶음(chunk) 하나 분석: 캐시 확인 → 모델 호출 → 파싱 / 음식 수 확인 → 캐시 저장 ---
+# 모델 호출과 파싱만 app.py(동기) / main.py(비동기)가 하고, 앞뒤 단계는 여기 것을 같이 씁니다.
+def meal_chunk_start(chunk, cache, model_name):
+    # (프롬프트, 캐시 키, 캐시에 있던 결과 또는 None)
+    prompt = meal_prompt(len(chunk))
+    cache_key = make_key(images_fingerprint(chunk), prompt, model_name)
+    cached = cache.get(cache_key)
+    return prompt, cache_key, json.loads(cached) if cached is not None else None
+
+
+def meal_chunk_done(data, chunk, cache, cache_key):
+    data = check_meal_items(data, len(chunk))
+    # 검증을 통과한 결과만 캐시에 남깁니다.
+    if data:
+        cache.set(cache_key, json.dumps(data, ensure_ascii=False))
+    return data
+
+
+# --- 나눠 보낸 결과들을 한 끼로 합치기 ---
+def merge_meal_results(results):
+    items, analysis, tips = [], [], []
+    for data in results:
+        items.extend(data.get("items", []))
+        if data.get("analysis"):
+            analysis.append(data["analysis"])
+        if data.get("tips"):
+            tips.append(data["tips"])
+    return {
+        "items": items,
+        "total": sum_nutrients(items),
+        "analysis": " ".join(analysis),
+        "tips": " ".join(tips),
+    }
+
+
+# --- diet_logs 문서 만들기 ---
+def build_log_data(item, record_date, record_time, meal_type, now):
+    log_data = {
+        "date": record_date.strftime("%Y-%m-%d"),
+        "datetime": record_time,
+        "meal_type": meal_type,
+        "food_name": item.get("food_name", ""),
+        "vitamin_info": item.get("vitamin_info", ""),
+        "timestamp": now,
+    }
+    for key in NUTRIENT_KEYS:
+        log_data[key] = item.get(key, 0)
+    return log_data
@@ -0,0 +1,87 @@
+# profiling.py (요청 하나만 골라 프로파일링: X-Profile 헤더)
+# - PROFILING_ENABLED=1일 때만 켜집니다. (운영에서 아무나 서버를 느리게 만들지 못하게)
+# - X-Profile: 1 → cProfile (.prof 파일, snakeviz / pstats로 보기)
+#   X-Profile: pyinstrument → pyinstrument HTML (설치되어 있을 때만, 없으면 cProfile)
+# - 결과는 PROFILE_DIR(기본 profiles/)에 저장하고, 파일 경로를 응답 헤더 X-Profile-Path로 알려 줍니다.
+# - 프로파일러는 프로세스 전체에 하나뿐이라 한 번에 한 요청만 잽니다. (이미 재는 중이면 그냥 처리)
+#   cProfile은 이벤트 루프 스레드를 통째로 재므로 같은 시간에 처리 중인 다른 요청도 섞여 나옵니다.
+import cProfile
+import itertools
+import os
+import re
+import threading
+import time
+
+import metrics
+
+_busy = threading.Lock()
+_seq = itertools.count(1)
+
+
+def requested_kind(header):
+    if os.environ.get("PROFILING_ENABLED", "0") != "1" or not header:
+        return None
+    header = header.strip().lower()
+    if header in ("", "0", "false", "off"):
+        return None
+    return "pyinstrument" if header == "pyinstrument" else "cprofile"
+
+
+class RequestProfiler:
+    def __init__(self, kind):
+        self.kind = kind
+        self._profiler = None
+        if kind == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+
+                self._profiler = Profiler(async_mode="enabled")
+            except ImportError:
+                self.kind = "cprofile"
+        if self._profiler is None:
+            self._profiler = cProfile.Profile()
+        self._start = 0.0
+
+    def start(self):
+        self._start = time.perf_counter()
+        if self.kind == "pyinstrument":
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop(self, label):
+        elapsed = time.perf_counter() - self._start
+        directory = os.environ.get("PROFILE_DIR", "profiles")
+        os.makedirs(directory, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{next(_seq)}-{re.sub(r'[^a-zA-Z0-9]+', '_', label).strip('_') or 'root'}"
+        if self.kind == "pyinstrument":
+            self._profiler.stop()
+            path = os.path.join(directory, name + ".html")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self._profiler.output_html())
+        else:
+            self._profiler.disable()
+            path = os.path.join(directory, name + ".prof")
+            self._profiler.dump_stats(path)
+        metrics.log("profile_saved", kind=self.kind, label=label, path=path, ms=round(elapsed * 1000, 1))
+        return path
+
+
+# 이미 다른 요청을 재는 중이면 None을 돌려줍니다.
+def start(kind):
+    if not _busy.acquire(blocking=False):
+        return None
+    try:
+        profiler = RequestProfiler(kind)
+        profiler.start()
+    except Exception:
+        _busy.release()
+        raise
+    return profiler
+
+
+def stop(profiler, label):
+    try:
+        return profiler.stop(label)
+    finally:
+        _busy.release()
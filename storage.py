@@ -0,0 +1,398 @@
+# storage.py (저장소: 사용자 / 식단 기록 / 합계)
+# - 화면과 API는 DB 종류를 모르고 저장소 객체(repository)의 메서드만 부릅니다.
+#   FirestoreRepository: 운영용 (기본값)
+#   SQLiteRepository: 네트워크 없이 쓰는 로컬 파일 DB (테스트, 현장 설치, 벤치마크)
+#   STORAGE_BACKEND=firestore|sqlite 로 고릅니다. (clients.get_repo)
+# - 식단 기록을 쓸 때 하루/주간 합계(rollup)도 같은 batch(트랜잭션)에서 함께 올려 둡니다.
+# - 보고서는 기록 전체를 다시 읽지 않고 (사용자, 날짜) 범위로 합계만 읽습니다.
+#   Firestore: users/{닉네임}/daily_rollups/{YYYY-MM-DD}, users/{닉네임}/weekly_rollups/{YYYY-Www}
+#   SQLite: daily_rollups / weekly_rollups 테이블 (기본 키가 (닉네임, 날짜) 인덱스)
+# - 읽기/쓰기 시간은 span "db_read" / "db_write"로 남깁니다. (metrics)
+import json
+import sqlite3
+import threading
+import uuid
+from datetime import date, datetime
+
+import metrics
+from nutrition import NUTRIENT_KEYS, to_number
+
+ROLLUPS_VERSION = 1
+
+
+def week_id(date_str):
+    year, week, _ = datetime.strptime(date_str, "%Y-%m-%d").date().isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def week_start(date_str):
+    d = datetime.strptime(date_str, "%Y-%m-%d").date()
+    return d.fromordinal(d.toordinal() - d.weekday()).strftime("%Y-%m-%d")
+
+
+def _rollup_increments(logs):
+    total = {key: 0 for key in NUTRIENT_KEYS}
+    for log_data in logs:
+        for key in NUTRIENT_KEYS:
+            total[key] += to_number(log_data.get(key, 0))
+    return total
+
+
+# --- datetime을 JSON으로 보관하기 (SQLite 저장소와 write_queue의 spool이 함께 사용) ---
+def json_default(value):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, date):
+        return {"__date__": value.isoformat()}
+    raise TypeError(f"저장할 수 없는 값: {type(value)}")
+
+
+def json_object_hook(obj):
+    if "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    if "__date__" in obj:
+        return date.fromisoformat(obj["__date__"])
+    return obj
+
+
+# --- Firestore batch / 트랜잭션에 올리는 도우미 ---
+# 주어진 batch(또는 트랜잭션)에 기록 + 합계 Increment를 올리고, 올린 쓰기 수를 돌려줍니다 (최대 500건).
+# log_id가 있는 기록은 그 ID로 저장합니다. 이미 저장된 기록을 빼는 것은 부르는 쪽(write_batch)이 합니다.
+# 트랜잭션은 충돌하면 함수를 다시 실행하므로 logs를 바꾸지 않습니다.
+def stage_diet_logs(db, batch, nickname, logs):
+    user_ref = db.collection('users').document(nickname)
+    logs_ref = user_ref.collection('diet_logs')
+    for log_data in logs:
+        log_data = dict(log_data)
+        log_id = log_data.pop("log_id", None)
+        # rolled_up: 합계에 이미 더한 기록 (ensure_rollups가 다시 세지 않습니다)
+        log_data["rolled_up"] = True
+        batch.set(logs_ref.document(log_id) if log_id else logs_ref.document(), log_data)
+    return len(logs) + stage_rollups(db, batch, nickname, logs)
+
+
+# 기록들을 날짜별 / 주별로 묶어서 합계 문서에 Increment. 올린 쓰기 수를 돌려줍니다.
+def stage_rollups(db, batch, nickname, logs):
+    from firebase_admin import firestore
+
+    user_ref = db.collection('users').document(nickname)
+    by_date = {}
+    for log_data in logs:
+        by_date.setdefault(log_data["date"], []).append(log_data)
+    by_week = {}
+    for date_str, day_logs in by_date.items():
+        total = _rollup_increments(day_logs)
+        batch.set(user_ref.collection('daily_rollups').document(date_str), {
+            "date": date_str,
+            "count": firestore.Increment(len(day_logs)),
+            **{key: firestore.Increment(value) for key, value in total.items()},
+        }, merge=True)
+        by_week.setdefault(week_id(date_str), []).extend(day_logs)
+    for week, week_logs in by_week.items():
+        total = _rollup_increments(week_logs)
+        batch.set(user_ref.collection('weekly_rollups').document(week), {
+            "week": week,
+            "start_date": week_start(week_logs[0]["date"]),
+            "count": firestore.Increment(len(week_logs)),
+            **{key: firestore.Increment(value) for key, value in total.items()},
+        }, merge=True)
+    return len(by_date) + len(by_week)
+
+
+def stage_profile(db, batch, nickname, data):
+    batch.set(db.collection('users').document(nickname), data, merge=True)
+    return 1
+
+
+class FirestoreRepository:
+    def __init__(self, db):
+        self.db = db
+
+    def _user_ref(self, nickname):
+        return self.db.collection('users').document(nickname)
+
+    # --- 사용자 ---
+    @metrics.timed("db_read")
+    def get_user(self, nickname):
+        doc = self._user_ref(nickname).get()
+        return doc.to_dict() if doc.exists else None
+
+    # --- 쓰기: 프로필(닉네임별로 합친 것)과 식단 기록을 트랜잭션 하나로 ---
+    # 전부 성공하거나 전부 실패하므로 기록과 합계가 어긋나지 않습니다.
+    # 같은 기록을 다시 보내도(응답을 못 받은 commit 재시도, 보낸 뒤 spool에서 지우기 전에 종료) 합계가 두 번
+    # 더해지지 않도록, 트랜잭션 안에서 log_id 문서가 이미 있는지 읽고 없는 기록만 씁니다.
+    @metrics.timed("db_write")
+    def write_batch(self, profiles=None, diet_logs=None):
+        from firebase_admin import firestore
+
+        log_refs = [
+            self._user_ref(nickname).collection('diet_logs').document(log_data["log_id"])
+            for nickname, logs in (diet_logs or {}).items() for log_data in logs if log_data.get("log_id")
+        ]
+
+        @firestore.transactional
+        def commit(transaction):
+            saved = {snap.reference.path for snap in transaction.get_all(log_refs) if snap.exists} if log_refs else set()
+            for nickname, data in (profiles or {}).items():
+                stage_profile(self.db, transaction, nickname, data)
+            for nickname, logs in (diet_logs or {}).items():
+                logs_ref = self._user_ref(nickname).collection('diet_logs')
+                new_logs = [
+                    log_data for log_data in logs
+                    if not log_data.get("log_id") or logs_ref.document(log_data["log_id"]).path not in saved
+                ]
+                if new_logs:
+                    stage_diet_logs(self.db, transaction, nickname, new_logs)
+
+        commit(self.db.transaction())
+
+    def save_profile(self, nickname, data):
+        self.write_batch(profiles={nickname: data})
+
+    def add_diet_logs(self, nickname, logs):
+        self.write_batch(diet_logs={nickname: logs})
+
+    # --- 읽기: 날짜 범위 조회 (start/end는 YYYY-MM-DD, 둘 다 포함) ---
+    @metrics.timed("db_read")
+    def list_diet_logs(self, nickname, start_date=None, end_date=None):
+        query = self._user_ref(nickname).collection('diet_logs')
+        if start_date:
+            query = query.where("date", ">=", start_date)
+        if end_date:
+            query = query.where("date", "<=", end_date)
+        return [{**d.to_dict(), "log_id": d.id} for d in query.order_by("date").stream()]
+
+    @metrics.timed("db_read")
+    def get_daily_rollup(self, nickname, date_str):
+        doc = self._user_ref(nickname).collection('daily_rollups').document(date_str).get()
+        return doc.to_dict() if doc.exists else None
+
+    @metrics.timed("db_read")
+    def list_daily_rollups(self, nickname, start_date=None, end_date=None, limit=30):
+        return self._list_rollups('daily_rollups', "date", nickname, start_date, end_date, limit)
+
+    # 주간 합계는 주 번호(YYYY-Www)로 거릅니다. start/end 날짜가 속한 주까지 포함합니다.
+    @metrics.timed("db_read")
+    def list_weekly_rollups(self, nickname, start_date=None, end_date=None, limit=12):
+        return self._list_rollups(
+            'weekly_rollups', "week", nickname,
+            week_id(start_date) if start_date else None, week_id(end_date) if end_date else None, limit,
+        )
+
+    def _list_rollups(self, collection, field, nickname, start, end, limit):
+        from firebase_admin import firestore
+
+        query = self._user_ref(nickname).collection(collection)
+        if start:
+            query = query.where(field, ">=", start)
+        if end:
+            query = query.where(field, "<=", end)
+        docs = query.order_by(field, direction=firestore.Query.DESCENDING).limit(limit).stream()
+        return [d.to_dict() for d in docs]
+
+    # --- 합계 문서가 생기기 전의 기록을 위한 1회성 재계산 ---
+    # 사용자 문서의 rollups_version을 보고, 아직이면 합계에 아직 더하지 않은 기록(rolled_up 없음)만 더합니다.
+    # 합계를 통째로 덮어쓰지 않고 Increment로 더하므로, 그사이 새로 저장된 기록(대기열 전송, API)의 합계가 사라지지 않습니다.
+    # 조각마다 트랜잭션 안에서 rolled_up을 다시 확인하고 함께 표시하므로, 두 세션이 동시에 돌려도 두 번 더해지지 않고
+    # 중간에 끊겨도 다음 번에 남은 기록부터 이어서 합니다.
+    def ensure_rollups(self, nickname):
+        user_ref = self._user_ref(nickname)
+        user_doc = user_ref.get()
+        if user_doc.exists and (user_doc.to_dict() or {}).get("rollups_version") == ROLLUPS_VERSION:
+            return False
+
+        legacy = [
+            doc.reference for doc in user_ref.collection('diet_logs').stream()
+            if not (doc.to_dict() or {}).get("rolled_up")
+        ]
+        # 사용자 문서도 옛 기록도 없으면(처음 입력한 닉네임 등) 아무것도 쓰지 않습니다.
+        # (빈 사용자 문서가 생기면 '내 정보 불러오기'가 저장한 적 없는 프로필을 찾은 것처럼 보입니다)
+        if not user_doc.exists and not legacy:
+            return False
+        # 기록 표시 + 합계 문서 쓰기가 트랜잭션 한도(500건) 안에 들도록 나눕니다.
+        for i in range(0, len(legacy), 150):
+            self._roll_up_legacy(nickname, legacy[i:i + 150])
+        user_ref.set({"rollups_version": ROLLUPS_VERSION}, merge=True)
+        return True
+
+    def _roll_up_legacy(self, nickname, refs):
+        from firebase_admin import firestore
+
+        @firestore.transactional
+        def apply(transaction):
+            logs = []
+            for snap in transaction.get_all(refs):
+                log_data = snap.to_dict() if snap.exists else None
+                if log_data and log_data.get("date") and not log_data.get("rolled_up"):
+                    logs.append((snap.reference, log_data))
+            if logs:
+                stage_rollups(self.db, transaction, nickname, [log_data for _, log_data in logs])
+                for ref, _ in logs:
+                    transaction.update(ref, {"rolled_up": True})
+
+        apply(self.db.transaction())
+
+
+# --- SQLite 저장소 ---
+# WAL 모드라서 Streamlit과 FastAPI가 같은 파일을 열어도 읽기가 쓰기를 기다리지 않습니다.
+# 식단 기록은 (nickname, date) 인덱스, 합계는 (nickname, date) / (nickname, week) 기본 키로 범위 조회합니다.
+_NUTRIENT_COLUMNS = ", ".join(f"{key} REAL NOT NULL DEFAULT 0" for key in NUTRIENT_KEYS)
+_SQLITE_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS users (
+    nickname TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS diet_logs (
+    id TEXT PRIMARY KEY,
+    nickname TEXT NOT NULL,
+    date TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_diet_logs_user_date ON diet_logs (nickname, date);
+CREATE TABLE IF NOT EXISTS daily_rollups (
+    nickname TEXT NOT NULL,
+    date TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    {_NUTRIENT_COLUMNS},
+    PRIMARY KEY (nickname, date)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS weekly_rollups (
+    nickname TEXT NOT NULL,
+    week TEXT NOT NULL,
+    start_date TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    {_NUTRIENT_COLUMNS},
+    PRIMARY KEY (nickname, week)
+) WITHOUT ROWID;
+"""
+_INCREMENT = ", ".join(f"{key} = {key} + excluded.{key}" for key in ["count", *NUTRIENT_KEYS])
+_UPSERT_DAILY = (
+    f"INSERT INTO daily_rollups (nickname, date, count, {', '.join(NUTRIENT_KEYS)}) "
+    f"VALUES ({', '.join('?' * (len(NUTRIENT_KEYS) + 3))}) "
+    f"ON CONFLICT (nickname, date) DO UPDATE SET {_INCREMENT}"
+)
+_UPSERT_WEEKLY = (
+    f"INSERT INTO weekly_rollups (nickname, week, start_date, count, {', '.join(NUTRIENT_KEYS)}) "
+    f"VALUES ({', '.join('?' * (len(NUTRIENT_KEYS) + 4))}) "
+    f"ON CONFLICT (nickname, week) DO UPDATE SET {_INCREMENT}"
+)
+
+
+def _number(value):
+    return int(value) if isinstance(value, float) and value.is_integer() else value
+
+
+class SQLiteRepository:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SQLITE_SCHEMA)
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # --- 사용자 ---
+    @metrics.timed("db_read")
+    def get_user(self, nickname):
+        rows = self._query("SELECT data FROM users WHERE nickname = ?", (nickname,))
+        return json.loads(rows[0]["data"], object_hook=json_object_hook) if rows else None
+
+    # --- 쓰기: 트랜잭션 하나로 (전부 성공하거나 전부 실패) ---
+    @metrics.timed("db_write")
+    def write_batch(self, profiles=None, diet_logs=None):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for nickname, data in (profiles or {}).items():
+                    self._merge_profile(nickname, data)
+                for nickname, logs in (diet_logs or {}).items():
+                    self._insert_diet_logs(nickname, logs)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def save_profile(self, nickname, data):
+        self.write_batch(profiles={nickname: data})
+
+    def add_diet_logs(self, nickname, logs):
+        self.write_batch(diet_logs={nickname: logs})
+
+    def _merge_profile(self, nickname, data):
+        row = self._conn.execute("SELECT data FROM users WHERE nickname = ?", (nickname,)).fetchone()
+        merged = json.loads(row["data"], object_hook=json_object_hook) if row else {}
+        merged.update(data)
+        self._conn.execute(
+            "INSERT INTO users (nickname, data) VALUES (?, ?) ON CONFLICT (nickname) DO UPDATE SET data = excluded.data",
+            (nickname, json.dumps(merged, default=json_default, ensure_ascii=False)),
+        )
+
+    def _insert_diet_logs(self, nickname, logs):
+        # 이미 저장된 log_id는 건너뛰고, 새로 들어간 기록만 합계에 더합니다. (재전송해도 두 번 더해지지 않음)
+        inserted = []
+        for log_data in logs:
+            log_data = dict(log_data)
+            log_id = log_data.pop("log_id", None) or uuid.uuid4().hex
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO diet_logs (id, nickname, date, data) VALUES (?, ?, ?, ?)",
+                (log_id, nickname, log_data["date"], json.dumps(log_data, default=json_default, ensure_ascii=False)),
+            )
+            if cursor.rowcount:
+                inserted.append(log_data)
+
+        by_date = {}
+        for log_data in inserted:
+            by_date.setdefault(log_data["date"], []).append(log_data)
+        for date_str, day_logs in by_date.items():
+            total = _rollup_increments(day_logs)
+            self._conn.execute(_UPSERT_DAILY, (nickname, date_str, len(day_logs), *total.values()))
+            self._conn.execute(
+                _UPSERT_WEEKLY,
+                (nickname, week_id(date_str), week_start(date_str), len(day_logs), *total.values()),
+            )
+
+    # --- 읽기: 날짜 범위 조회 (start/end는 YYYY-MM-DD, 둘 다 포함) ---
+    @metrics.timed("db_read")
+    def list_diet_logs(self, nickname, start_date=None, end_date=None):
+        rows = self._query(
+            "SELECT id, data FROM diet_logs WHERE nickname = ? AND date >= ? AND date <= ? ORDER BY date",
+            (nickname, start_date or "", end_date or "9999"),
+        )
+        return [{**json.loads(r["data"], object_hook=json_object_hook), "log_id": r["id"]} for r in rows]
+
+    @metrics.timed("db_read")
+    def get_daily_rollup(self, nickname, date_str):
+        rows = self._query("SELECT * FROM daily_rollups WHERE nickname = ? AND date = ?", (nickname, date_str))
+        return self._rollup_dict(rows[0]) if rows else None
+
+    @metrics.timed("db_read")
+    def list_daily_rollups(self, nickname, start_date=None, end_date=None, limit=30):
+        rows = self._query(
+            "SELECT * FROM daily_rollups WHERE nickname = ? AND date >= ? AND date <= ? ORDER BY date DESC LIMIT ?",
+            (nickname, start_date or "", end_date or "9999", limit),
+        )
+        return [self._rollup_dict(r) for r in rows]
+
+    @metrics.timed("db_read")
+    def list_weekly_rollups(self, nickname, start_date=None, end_date=None, limit=12):
+        rows = self._query(
+            "SELECT * FROM weekly_rollups WHERE nickname = ? AND week >= ? AND week <= ? ORDER BY week DESC LIMIT ?",
+            (nickname, week_id(start_date) if start_date else "", week_id(end_date) if end_date else "9999", limit),
+        )
+        return [self._rollup_dict(r) for r in rows]
+
+    def _rollup_dict(self, row):
+        return {key: _number(row[key]) for key in row.keys() if key != "nickname"}
+
+    # 합계는 기록과 같은 트랜잭션에서 처음부터 함께 쓰므로 다시 계산할 일이 없습니다.
+    def ensure_rollups(self, nickname):
+        return False
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,202 @@
+# write_queue.py (나중에 쓰기: 식단 기록 / 프로필 저장 대기열)
+# - 화면과 API는 로컬 SQLite 파일(spool)에 적고 바로 돌아갑니다. DB를 기다리지 않습니다.
+# - 백그라운드 스레드가 모아서(같은 사용자의 프로필은 하나로 합치고, 식단 기록은 합계 Increment를 묶어서)
+#   저장소(Firestore / SQLite 트랜잭션)로 보냅니다. 실패하면 지수 백오프로 다시 시도하고, 그동안 기록은 spool에 남아 있습니다.
+# - 프로세스가 죽어도 spool에 남은 기록은 다음 실행 때 이어서 보냅니다.
+# - 대기열 길이(write_queue_depth)와 flush 시간(write_queue_flush_seconds)을 metrics에 남깁니다.
+import atexit
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+import clients
+import metrics
+from storage import json_default, json_object_hook
+
+# batch 하나에 최대 500건까지 쓸 수 있어서, 여유를 두고 끊습니다.
+MAX_WRITES_PER_BATCH = 400
+# 다른 프로세스가 가져간 작업이 이 시간 넘게 끝나지 않으면 다시 가져옵니다.
+CLAIM_TIMEOUT = 120
+
+
+class WriteBehindQueue:
+    def __init__(self, spool_path, get_repo=clients.get_repo, flush_interval=0.5, max_backoff=30.0):
+        self.spool_path = spool_path
+        self.get_repo = get_repo
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(spool_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS ops (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                nickname TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created REAL NOT NULL,
+                claimed_at REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_ops_nickname ON ops (nickname)")
+        self._update_depth()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    # --- 넣기 ---
+    def enqueue_profile(self, nickname, data):
+        self._enqueue("profile", nickname, data)
+
+    def enqueue_diet_logs(self, nickname, logs):
+        # 재시도해도 같은 문서가 되도록 기록마다 ID를 미리 정해 둡니다.
+        logs = [{**log_data, "log_id": log_data.get("log_id") or uuid.uuid4().hex} for log_data in logs]
+        self._enqueue("diet_logs", nickname, logs)
+
+    def _enqueue(self, kind, nickname, payload):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO ops (kind, nickname, payload, created) VALUES (?, ?, ?, ?)",
+                (kind, nickname, json.dumps(payload, default=json_default, ensure_ascii=False), time.time()),
+            )
+        self._update_depth()
+        self._wake.set()
+
+    # 남은 작업 수는 spool에서 셉니다. spool은 app.py / main.py가 함께 쓰므로
+    # 다른 프로세스가 보내 준 작업도 바로 반영됩니다.
+    def has_pending(self, nickname):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM ops WHERE nickname = ? LIMIT 1", (nickname,)).fetchone() is not None
+
+    def depth(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM ops").fetchone()[0]
+
+    def _update_depth(self):
+        metrics.set_gauge("write_queue_depth", self.depth())
+
+    # --- 보내기 ---
+    def flush(self, timeout=5.0):
+        # 대기열이 빌 때까지(또는 timeout까지) 기다립니다. 종료 직전이나 벤치마크에서 씁니다.
+        deadline = time.time() + timeout
+        self._wake.set()
+        while self.depth() and time.time() < deadline:
+            time.sleep(0.05)
+        return self.depth() == 0
+
+    def close(self):
+        self.flush(timeout=2.0)
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=2.0)
+
+    def _run(self):
+        failures, delay = 0, 0.0
+        while not self._stop.is_set():
+            self._wake.wait(timeout=delay or self.flush_interval)
+            self._wake.clear()
+            try:
+                if self._flush_once():
+                    # 남은 작업이 더 있을 수 있으니 바로 한 번 더 봅니다.
+                    self._wake.set()
+                failures, delay = 0, 0.0
+            except Exception as e:
+                metrics.inc("write_queue_flush_errors")
+                # 0.5초부터 두 배씩, 최대 max_backoff까지 (지터를 섞어 여러 프로세스가 한꺼번에 몰리지 않게)
+                failures += 1
+                delay = min(self.max_backoff, 0.5 * 2 ** (failures - 1)) * random.uniform(0.5, 1.0)
+                metrics.log("write_queue_flush_failed", level=logging.WARNING, retry_in=round(delay, 1), error=str(e))
+
+    def _claim(self):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, kind, nickname, payload FROM ops "
+                    "WHERE claimed_at IS NULL OR claimed_at < ? ORDER BY id LIMIT 500",
+                    (now - CLAIM_TIMEOUT,),
+                ).fetchall()
+                if rows:
+                    self._conn.executemany("UPDATE ops SET claimed_at = ? WHERE id = ?", [(now, r[0]) for r in rows])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return rows
+
+    def _release(self, ids):
+        with self._lock:
+            self._conn.executemany("UPDATE ops SET claimed_at = NULL WHERE id = ?", [(i,) for i in ids])
+
+    def _flush_once(self):
+        rows = self._claim()
+        if not rows:
+            return False
+        repo = self.get_repo()
+        if repo is None:
+            self._release([r[0] for r in rows])
+            raise RuntimeError(clients.db_error or "DB 연결이 없습니다.")
+
+        # batch 한도를 넘지 않도록 여러 묶음으로 나눕니다. 묶음마다 commit 후 spool에서 지웁니다.
+        groups, group, writes = [], [], 0
+        for row in rows:
+            payload = json.loads(row[3], object_hook=json_object_hook)
+            estimate = 1 if row[1] == "profile" else len(payload) * 3
+            if group and writes + estimate > MAX_WRITES_PER_BATCH:
+                groups.append(group)
+                group, writes = [], 0
+            group.append((row[0], row[1], row[2], payload))
+            writes += estimate
+        groups.append(group)
+
+        for i, group in enumerate(groups):
+            start = time.perf_counter()
+            try:
+                self._commit_group(repo, group)
+            except Exception:
+                self._release([op[0] for g in groups[i:] for op in g])
+                raise
+            metrics.observe("write_queue_flush_seconds", time.perf_counter() - start)
+            metrics.inc("write_queue_flushed_ops", len(group))
+            self._done(group)
+        return True
+
+    def _commit_group(self, repo, group):
+        # 같은 사용자의 프로필 저장은 순서대로 합쳐 한 번만, 식단 기록은 사용자별로 모아 한 번에 씁니다.
+        profiles, diet_logs = {}, {}
+        for _, kind, nickname, payload in group:
+            if kind == "profile":
+                profiles.setdefault(nickname, {}).update(payload)
+            else:
+                diet_logs.setdefault(nickname, []).extend(payload)
+        repo.write_batch(profiles=profiles, diet_logs=diet_logs)
+
+    def _done(self, group):
+        with self._lock:
+            self._conn.executemany("DELETE FROM ops WHERE id = ?", [(op[0],) for op in group])
+        self._update_depth()
+
+
+# --- 공용 대기열 (프로세스마다 하나) ---
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = WriteBehindQueue(
+                os.environ.get("WRITE_SPOOL_PATH", "write_spool.sqlite3"),
+                flush_interval=float(os.environ.get("WRITE_FLUSH_INTERVAL", "0.5")),
+            )
+            atexit.register(_writer.close)
+        return _writer